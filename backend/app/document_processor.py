@@ -1,29 +1,80 @@
 """Document processing module for PowerPoint and PDF files."""
 import os
-from typing import Dict, List, Any
+import io
+import tempfile
+from itertools import accumulate
+from typing import Dict, List, Any, Tuple
 from pptx import Presentation
-import PyPDF2
+from pptx.oxml.ns import qn
+import pypdf
 from pdf2image import convert_from_path
-import pytesseract
+import aiopytesseract
 from PIL import Image
 import asyncio
+from config import settings
+from .utils import generate_file_fingerprint, json_dumps, json_loads
+
+# Bump whenever extraction output changes, so content cached by older code is re-extracted
+EXTRACTOR_VERSION = 1
+
+_A_P = qn('a:p')
+_A_T = qn('a:t')
+_A_BR = qn('a:br')
+
+def _shape_text(shape) -> str:
+    """Read a shape's text in one walk of its XML, one line per paragraph."""
+    return "\n".join(
+        "".join((node.text or "") if node.tag == _A_T else "\n" for node in paragraph.iter(_A_T, _A_BR))
+        for paragraph in shape.element.iter(_A_P)
+    )
 
 class DocumentProcessor:
     """Handles document parsing and text extraction."""
     
-    def __init__(self):
+    def __init__(self, cache_dir: str = settings.document_cache_directory):
         self.supported_formats = ['.pptx', '.ppt', '.pdf']
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
     
     async def process_document(self, file_path: str, document_id: str) -> Dict[str, Any]:
         """Process a document and extract its content."""
         file_extension = os.path.splitext(file_path)[1].lower()
         
+        if file_extension not in self.supported_formats:
+            raise ValueError(f"Unsupported file format: {file_extension}")
+        
+        # Identical uploads reuse the previously extracted content
+        fingerprint = generate_file_fingerprint(file_path)
+        cache_path = os.path.join(self.cache_dir, f"{fingerprint}-v{EXTRACTOR_VERSION}.json")
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as cache_file:
+                extracted_data = json_loads(cache_file.read())
+            extracted_data["document_id"] = document_id
+            return extracted_data
+        
         if file_extension in ['.pptx', '.ppt']:
-            return await self._process_powerpoint(file_path, document_id)
-        elif file_extension == '.pdf':
-            return await self._process_pdf(file_path, document_id)
+            extracted_data = await self._process_powerpoint(file_path, document_id)
         else:
-            raise ValueError(f"Unsupported file format: {file_extension}")
+            extracted_data = await self._process_pdf(file_path, document_id)
+        
+        extracted_data["fingerprint"] = fingerprint
+        # Partial results (e.g. a transient OCR failure) are not cached, so a later
+        # upload of the same file gets a fresh attempt
+        if "ocr_error" not in extracted_data:
+            self._write_cache(cache_path, extracted_data)
+        
+        return extracted_data
+    
+    def _write_cache(self, cache_path: str, extracted_data: Dict[str, Any]) -> None:
+        """Write a cache entry atomically: readers see the old file, the new one or none"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(json_dumps(extracted_data))
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
     
     async def _process_powerpoint(self, file_path: str, document_id: str) -> Dict[str, Any]:
         """Extract content from PowerPoint presentations."""
@@ -50,14 +101,15 @@ class DocumentProcessor:
             }
             
             # Extract title
-            if slide.shapes.title:
-                slide_data["title"] = slide.shapes.title.text
-                all_text.append(slide.shapes.title.text)
+            title_shape = slide.shapes.title
+            if title_shape:
+                slide_data["title"] = _shape_text(title_shape)
+                all_text.append(slide_data["title"])
             
             # Extract content from shapes
             for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text = shape.text.strip()
+                if shape.has_text_frame:
+                    text = _shape_text(shape).strip()
                     if text:
                         slide_data["content"].append(text)
                         all_text.append(text)
@@ -94,44 +146,92 @@ class DocumentProcessor:
             "images": []
         }
         
-        all_text = []
-        
-        # Extract text using PyPDF2
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
+        # Extract text using pypdf over a single buffered stream
+        with io.BufferedReader(open(file_path, 'rb', buffering=0), buffer_size=1 << 20) as file:
+            pdf_reader = pypdf.PdfReader(file, strict=False)
             extracted_data["page_count"] = len(pdf_reader.pages)
             
             for page_num, page in enumerate(pdf_reader.pages):
-                text = page.extract_text()
                 page_data = {
                     "page_number": page_num + 1,
-                    "text": text
+                    "text": page.extract_text() or ""
                 }
                 extracted_data["pages"].append(page_data)
-                all_text.append(f"Page {page_num + 1}:\n{text}")
         
-        extracted_data["text"] = "\n\n".join(all_text)
+        extracted_data["text"] = self._join_page_texts(extracted_data["pages"])
         
-        # If text extraction is poor, try OCR
-        if len(extracted_data["text"].strip()) < 100:
-            extracted_data = await self._process_pdf_with_ocr(file_path, document_id, extracted_data)
+        # OCR only the pages whose text extraction is poor (typically scanned pages)
+        ocr_page_numbers = [
+            page["page_number"] for page in extracted_data["pages"]
+            if len(page["text"].strip()) < 30
+        ]
+        if ocr_page_numbers:
+            extracted_data = await self._process_pdf_with_ocr(
+                file_path, document_id, extracted_data, ocr_page_numbers
+            )
         
         return extracted_data
     
-    async def _process_pdf_with_ocr(self, file_path: str, document_id: str, extracted_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Use OCR for PDFs with poor text extraction."""
+    async def _process_pdf_with_ocr(
+        self,
+        file_path: str,
+        document_id: str,
+        extracted_data: Dict[str, Any],
+        page_numbers: List[int]
+    ) -> Dict[str, Any]:
+        """Use OCR for the PDF pages with poor text extraction."""
         try:
-            images = convert_from_path(file_path)
-            ocr_text = []
+            page_texts: Dict[int, str] = {}
+            render_batch = os.cpu_count() or 1
+            
+            # Rasterized page files flow through a bounded queue so OCR starts on the
+            # first pages while later ones are still rendering, and only a handful of
+            # page images exist on disk at any time.
+            queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ocr_queue_size)
             
-            for i, image in enumerate(images):
-                text = pytesseract.image_to_string(image)
-                ocr_text.append(f"Page {i + 1}:\n{text}")
+            with tempfile.TemporaryDirectory() as output_folder:
+                async def rasterize_pages() -> None:
+                    try:
+                        for first_page, last_page in self._page_ranges(page_numbers, render_batch):
+                            # Parallel pdftoppm workers, one page each. Large documents can
+                            # exhaust file descriptors on macOS (raise with `ulimit -n 10000`).
+                            image_paths = await asyncio.to_thread(
+                                convert_from_path,
+                                file_path,
+                                dpi=200,
+                                fmt="png",
+                                first_page=first_page,
+                                last_page=last_page,
+                                thread_count=last_page - first_page + 1,
+                                output_folder=output_folder,
+                                paths_only=True
+                            )
+                            for page_number, image_path in enumerate(image_paths, start=first_page):
+                                await queue.put((page_number, image_path))
+                    finally:
+                        for _ in range(settings.ocr_concurrency):
+                            await queue.put(None)
                 
-                if i < len(extracted_data["pages"]):
-                    extracted_data["pages"][i]["text"] = text
+                async def ocr_pages() -> None:
+                    # Each page is OCR'd in its own tesseract subprocess
+                    while (item := await queue.get()) is not None:
+                        page_number, image_path = item
+                        page_texts[page_number] = await aiopytesseract.image_to_string(image_path)
+                        os.remove(image_path)
+                
+                tasks = [asyncio.ensure_future(rasterize_pages())]
+                tasks += [asyncio.ensure_future(ocr_pages()) for _ in range(settings.ocr_concurrency)]
+                try:
+                    await asyncio.gather(*tasks)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+            
+            for page in extracted_data["pages"]:
+                if page["page_number"] in page_texts:
+                    page["text"] = page_texts[page["page_number"]]
             
-            extracted_data["text"] = "\n\n".join(ocr_text)
+            extracted_data["text"] = self._join_page_texts(extracted_data["pages"])
             extracted_data["ocr_used"] = True
             
         except Exception as e:
@@ -140,6 +240,27 @@ class DocumentProcessor:
         
         return extracted_data
     
+    def _page_ranges(self, page_numbers: List[int], max_length: int) -> List[Tuple[int, int]]:
+        """Group sorted page numbers into contiguous (first, last) ranges of bounded length."""
+        ranges = []
+        for page_number in page_numbers:
+            if ranges and page_number == ranges[-1][1] + 1 and page_number - ranges[-1][0] < max_length:
+                ranges[-1] = (ranges[-1][0], page_number)
+            else:
+                ranges.append((page_number, page_number))
+        return ranges
+    
+    def _join_page_texts(self, pages: List[Dict[str, Any]]) -> str:
+        """Join page texts under "Page N:" headers.
+        
+        The parts reference each page's text directly, so it is copied once into the
+        result instead of first into a prefixed per-page string.
+        """
+        parts = []
+        for page in pages:
+            parts += (f"Page {page['page_number']}:\n", page["text"], "\n\n")
+        return "".join(parts[:-1])
+    
     def _extract_table_from_shape(self, shape) -> List[List[str]]:
         """Extract table data from PowerPoint shape."""
         table = shape.table
@@ -157,15 +278,17 @@ class DocumentProcessor:
         """Split text into overlapping chunks for better retrieval."""
         chunks = []
         words = text.split()
+        joined = " ".join(words)
+        # word_starts[k] is the offset of word k in `joined`; chunks are sliced from it directly
+        word_starts = [0, *accumulate(len(word) + 1 for word in words)]
         
         for i in range(0, len(words), chunk_size - overlap):
-            chunk_words = words[i:i + chunk_size]
-            chunk_text = " ".join(chunk_words)
+            end = min(i + chunk_size, len(words))
             
             chunks.append({
-                "text": chunk_text,
+                "text": joined[word_starts[i]:word_starts[end] - 1],
                 "start_index": i,
-                "end_index": min(i + chunk_size, len(words))
+                "end_index": end
             })
         
         return chunks
@@ -1,17 +1,31 @@
 """Question answering module using LLM and vector search."""
 import os
-from typing import List, Dict, Any
+import re
+import hashlib
+from typing import AsyncIterator, List, Dict, Any
 import openai
-from openai import OpenAI
+from openai import AsyncOpenAI
+from cachetools import TTLCache
 import asyncio
 from .vector_store import VectorStore
 
+# Punctuation ignored at the edges of words when highlighting
+_EDGE_PUNCTUATION = '.,!?;:'
+
+# Phrases the model uses when the context doesn't contain the answer
+_NOT_FOUND_RE = re.compile(r"I couldn't find|not in the context")
+
+_NO_PASSAGES_ANSWER = "I couldn't find relevant information in the brand playbook to answer your question."
+
 class QuestionAnswering:
     """Handles question answering using retrieval-augmented generation."""
     
     def __init__(self, vector_store: VectorStore):
         self.vector_store = vector_store
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        
+        # Repeated questions are answered from memory instead of re-running search + LLM
+        self.answer_cache = TTLCache(maxsize=1024, ttl=3600)
     
     async def answer_question(
         self, 
@@ -20,13 +34,20 @@ class QuestionAnswering:
         top_k: int = 5
     ) -> Dict[str, Any]:
         """Answer a question using relevant passages from the brand playbook."""
+        # The store's generation changes on every add/delete, retiring stale answers
+        cache_key = hashlib.sha1(
+            f"{self.vector_store.generation}|{document_id}|{top_k}|{question.lower().strip()}".encode()
+        ).hexdigest()
+        cached = self.answer_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         # Search for relevant passages
         passages = await self.vector_store.search(question, document_id, top_k)
         
         if not passages:
             return {
-                "answer": "I couldn't find relevant information in the brand playbook to answer your question.",
+                "answer": _NO_PASSAGES_ANSWER,
                 "confidence": 0.0,
                 "passages": []
             }
@@ -45,43 +66,37 @@ class QuestionAnswering:
                 "highlighted_text": self._highlight_relevant_text(passage["text"], question)
             })
         
-        return {
+        result = {
             "answer": answer_data["answer"],
             "confidence": answer_data["confidence"],
             "passages": formatted_passages
         }
-    
-    async def _generate_answer(self, question: str, passages: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Generate answer using OpenAI GPT model."""
-        
-        # Prepare context from passages
-        context = self._prepare_context(passages)
-        
-        # Create prompt
-        prompt = f"""You are an AI assistant specializing in brand guidelines and playbooks. 
-        Answer the following question based ONLY on the provided context from the brand playbook.
-        If the information isn't in the context, say so clearly.
         
-        Context from brand playbook:
-        {context}
+        if not answer_data.get("error"):
+            self.answer_cache[cache_key] = result
         
-        Question: {question}
+        return result
+    
+    async def stream_answer(
+        self,
+        question: str,
+        document_id: str = None,
+        top_k: int = 5
+    ) -> AsyncIterator[str]:
+        """Stream answer tokens as they are generated (e.g. into a StreamingResponse)."""
+        passages = await self.vector_store.search(question, document_id, top_k)
         
-        Provide a clear, concise answer and indicate your confidence level (0-1) in the accuracy of your response."""
+        if not passages:
+            yield _NO_PASSAGES_ANSWER
+            return
         
+        async for token in self._stream_completion(question, passages):
+            yield token
+    
+    async def _generate_answer(self, question: str, passages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Generate answer using OpenAI GPT model."""
         try:
-            # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {"role": "system", "content": "You are a brand expert assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=500
-            )
-            
-            answer_text = response.choices[0].message.content
+            answer_text = "".join([token async for token in self._stream_completion(question, passages)])
             
             # Extract confidence from response (you might want to use a more sophisticated approach)
             confidence = self._extract_confidence(answer_text, passages)
@@ -95,9 +110,44 @@ class QuestionAnswering:
             print(f"Error generating answer: {str(e)}")
             return {
                 "answer": "I encountered an error while processing your question. Please try again.",
-                "confidence": 0.0
+                "confidence": 0.0,
+                "error": True
             }
     
+    async def _stream_completion(self, question: str, passages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """Stream the completion for a question without blocking the event loop."""
+        
+        # Prepare context from passages
+        context = self._prepare_context(passages)
+        
+        # Create prompt
+        prompt = f"""You are an AI assistant specializing in brand guidelines and playbooks. 
+        Answer the following question based ONLY on the provided context from the brand playbook.
+        If the information isn't in the context, say so clearly.
+        
+        Context from brand playbook:
+        {context}
+        
+        Question: {question}
+        
+        Provide a clear, concise answer and indicate your confidence level (0-1) in the accuracy of your response."""
+        
+        # Call OpenAI API
+        stream = await self.client.chat.completions.create(
+            model="gpt-4-turbo-preview",
+            messages=[
+                {"role": "system", "content": "You are a brand expert assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1,
+            max_tokens=500,
+            stream=True
+        )
+        
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
     def _prepare_context(self, passages: List[Dict[str, Any]]) -> str:
         """Prepare context from retrieved passages."""
         context_parts = []
@@ -120,7 +170,7 @@ class QuestionAnswering:
         avg_score = sum(top_scores) / len(top_scores)
         
         # Adjust based on answer characteristics
-        if "I couldn't find" in answer or "not in the context" in answer:
+        if _NOT_FOUND_RE.search(answer):
             return max(0.2, avg_score * 0.5)
         
         return min(0.95, avg_score)
@@ -128,14 +178,9 @@ class QuestionAnswering:
     def _highlight_relevant_text(self, text: str, question: str) -> str:
         """Highlight parts of text relevant to the question."""
         # Simple keyword highlighting (can be improved with more sophisticated NLP)
-        question_words = set(question.lower().split())
-        words = text.split()
-        highlighted = []
-        
-        for word in words:
-            if word.lower().strip('.,!?;:') in question_words:
-                highlighted.append(f"**{word}**")
-            else:
-                highlighted.append(word)
+        question_words = {word.strip(_EDGE_PUNCTUATION) for word in question.lower().split()}
         
-        return " ".join(highlighted)
+        return " ".join([
+            f"**{word}**" if word.lower().strip(_EDGE_PUNCTUATION) in question_words else word
+            for word in text.split()
+        ])
@@ -2,22 +2,53 @@
 
 import os
 import hashlib
-from typing import List, Dict, Any
+from collections import Counter
+from typing import List, Dict, Any, Union
 import re
 from datetime import datetime
 import json
 
+try:
+    import orjson
+except ImportError:  # Fall back to the slower stdlib encoder/decoder
+    orjson = None
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s\-.,!?;:()\'"]+')
+_UNSAFE_FILENAME_CHARS_RE = re.compile(r'[^\w\s.-]')
+
+# Simple stopwords for keyword extraction
+_STOPWORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+    'of', 'with', 'by', 'from', 'as', 'is', 'was', 'are', 'were', 'been',
+    'be', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
+    'could', 'should', 'may', 'might', 'must', 'shall', 'can', 'need',
+    'it', 'this', 'that', 'these', 'those', 'i', 'you', 'he', 'she', 'we',
+    'they', 'them', 'their', 'what', 'which', 'who', 'when', 'where',
+    'why', 'how', 'not', 'no', 'yes'
+})
+
 def clean_text(text: str) -> str:
     """Clean and normalize text"""
     # Remove excessive whitespace
-    text = re.sub(r'\s+', ' ', text)
+    text = _WHITESPACE_RE.sub(' ', text)
     # Remove special characters but keep punctuation
-    text = re.sub(r'[^\w\s\-.,!?;:()\'"]+', '', text)
+    text = _SPECIAL_CHARS_RE.sub('', text)
     return text.strip()
 
-def generate_document_id(content: str) -> str:
+def generate_document_id(content: Union[str, bytes]) -> str:
     """Generate a unique ID for a document based on its content"""
-    return hashlib.md5(content.encode()).hexdigest()
+    if isinstance(content, str):
+        content = content.encode()
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+def generate_file_fingerprint(file_path: str) -> str:
+    """Generate a content fingerprint for a file without loading it into memory"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 def format_file_size(bytes: int) -> str:
     """Format file size in human-readable format"""
@@ -49,39 +80,34 @@ def create_metadata(filename: str, file_size: int, user: str, **kwargs) -> Dict[
 
 def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
     """Extract keywords from text using simple frequency analysis"""
-    # Simple stopwords
-    stopwords = {
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
-        'of', 'with', 'by', 'from', 'as', 'is', 'was', 'are', 'were', 'been',
-        'be', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
-        'could', 'should', 'may', 'might', 'must', 'shall', 'can', 'need',
-        'it', 'this', 'that', 'these', 'those', 'i', 'you', 'he', 'she', 'we',
-        'they', 'them', 'their', 'what', 'which', 'who', 'when', 'where',
-        'why', 'how', 'not', 'no', 'yes'
-    }
-    
     # Clean and tokenize
     words = clean_text(text.lower()).split()
     
-    # Count word frequency
-    word_freq = {}
-    for word in words:
-        if len(word) > 3 and word not in stopwords:
-            word_freq[word] = word_freq.get(word, 0) + 1
-    
-    # Sort by frequency and return top keywords
-    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-    return [word for word, freq in sorted_words[:max_keywords]]
+    # Count word frequency and return top keywords
+    word_freq = Counter(word for word in words if len(word) > 3 and word not in _STOPWORDS)
+    return [word for word, freq in word_freq.most_common(max_keywords)]
 
 def chunk_list(lst: List[Any], chunk_size: int) -> List[List[Any]]:
     """Split a list into chunks of specified size"""
     return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
 
-def safe_json_loads(json_str: str, default: Any = None) -> Any:
+def json_loads(data: Union[str, bytes]) -> Any:
+    """Decode JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj: Any) -> bytes:
+    """Encode JSON as UTF-8 bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def safe_json_loads(json_str: Union[str, bytes], default: Any = None) -> Any:
     """Safely load JSON with default value on error"""
     try:
-        return json.loads(json_str)
-    except (json.JSONDecodeError, TypeError):
+        return json_loads(json_str)
+    except (json.JSONDecodeError, TypeError):  # orjson.JSONDecodeError subclasses json's
         return default
 
 def calculate_reading_time(text: str, words_per_minute: int = 200) -> int:
@@ -94,7 +120,7 @@ def sanitize_filename(filename: str) -> str:
     # Remove any path separators
     filename = os.path.basename(filename)
     # Remove potentially dangerous characters
-    filename = re.sub(r'[^\w\s.-]', '', filename)
+    filename = _UNSAFE_FILENAME_CHARS_RE.sub('', filename)
     # Limit length
     name, ext = os.path.splitext(filename)
     if len(name) > 100:
@@ -1,10 +1,28 @@
 """Vector store module using ChromaDB."""
 import chromadb
-from chromadb.utils import embedding_functions
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from openai import AsyncOpenAI, OpenAI
 import os
 from typing import List, Dict, Any
 import asyncio
 from datetime import datetime
+from config import settings
+
+class OpenAIEmbeddingFunction(EmbeddingFunction):
+    """OpenAI embeddings truncated to a fixed number of dimensions."""
+    
+    def __init__(self, api_key: str, model_name: str, dimensions: int):
+        self.client = OpenAI(api_key=api_key)
+        self.model_name = model_name
+        self.dimensions = dimensions
+    
+    def __call__(self, input: Documents) -> Embeddings:
+        response = self.client.embeddings.create(
+            model=self.model_name,
+            input=input,
+            dimensions=self.dimensions
+        )
+        return [item.embedding for item in response.data]
 
 class VectorStore:
     """Manages vector embeddings and similarity search using ChromaDB."""
@@ -13,18 +31,35 @@ class VectorStore:
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(path="./chroma_db")
         
-        # Use OpenAI embeddings
-        self.embedding_function = embedding_functions.OpenAIEmbeddingFunction(
+        # Use OpenAI embeddings, truncated to keep the index small
+        self.embedding_model = settings.embedding_model
+        self.embedding_dimensions = settings.embedding_dimensions
+        self.embedding_function = OpenAIEmbeddingFunction(
             api_key=os.getenv("OPENAI_API_KEY"),
-            model_name="text-embedding-ada-002"
+            model_name=self.embedding_model,
+            dimensions=self.embedding_dimensions
         )
         
-        # Get or create collection
+        # Async client for bulk document embedding
+        self.openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        
+        # Get or create collection (v2 holds 512-dimension text-embedding-3-small vectors)
         self.collection = self.client.get_or_create_collection(
-            name="brand_playbooks",
+            name="brand_playbooks_v2",
             embedding_function=self.embedding_function,
-            metadata={"description": "Brand playbook documents"}
+            metadata={
+                "description": "Brand playbook documents",
+                # Cosine distance keeps `1 - distance` a valid relevance score; the
+                # denser graph and wider search beam trade index time for recall
+                "hnsw:space": "cosine",
+                "hnsw:M": 32,
+                "hnsw:construction_ef": 200,
+                "hnsw:search_ef": 64
+            }
         )
+        
+        # Bumped on every write so callers can key caches on the indexed content
+        self.generation = 0
     
     async def add_document(self, document_id: str, extracted_data: Dict[str, Any]) -> None:
         """Add document chunks to vector store."""
@@ -34,6 +69,13 @@ class VectorStore:
         if not chunks:
             raise ValueError("No content to index")
         
+        fingerprint = extracted_data.get("fingerprint", "")
+        
+        # Identical content indexed before: reuse its embeddings instead of re-embedding
+        if fingerprint and self._copy_indexed_document(document_id, fingerprint):
+            self.generation += 1
+            return
+        
         # Prepare data for ChromaDB
         documents = []
         metadatas = []
@@ -48,19 +90,69 @@ class VectorStore:
                 "chunk_index": i,
                 "source": chunk.get("source", ""),
                 "page_number": chunk.get("page_number", 0),
-                "document_type": extracted_data.get("type", "unknown")
+                "document_type": extracted_data.get("type", "unknown"),
+                "fingerprint": fingerprint
             })
             ids.append(chunk_id)
         
-        # Add to ChromaDB in batches
-        batch_size = 100
-        for i in range(0, len(documents), batch_size):
-            batch_end = min(i + batch_size, len(documents))
-            self.collection.add(
-                documents=documents[i:batch_end],
-                metadatas=metadatas[i:batch_end],
-                ids=ids[i:batch_end]
-            )
+        # Embed up front so ChromaDB doesn't issue one blocking request per batch
+        embeddings = await self._embed_documents(documents)
+        
+        # Add to ChromaDB in a single write
+        self.collection.add(
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=ids
+        )
+        self.generation += 1
+    
+    async def _embed_documents(self, documents: List[str]) -> List[List[float]]:
+        """Embed documents with concurrent OpenAI requests."""
+        batch_size = 512
+        semaphore = asyncio.Semaphore(8)  # Stay within OpenAI rate limits
+        
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                response = await self.openai_client.embeddings.create(
+                    model=self.embedding_model,
+                    input=batch,
+                    dimensions=self.embedding_dimensions
+                )
+            return [item.embedding for item in response.data]
+        
+        batches = await asyncio.gather(*(
+            embed_batch(documents[i:i + batch_size])
+            for i in range(0, len(documents), batch_size)
+        ))
+        return [embedding for batch in batches for embedding in batch]
+    
+    def _copy_indexed_document(self, document_id: str, fingerprint: str) -> bool:
+        """Index a document by copying the chunks of an earlier upload with the same content."""
+        match = self.collection.get(where={"fingerprint": fingerprint}, limit=1)
+        if not match["ids"]:
+            return False
+        
+        source_id = match["metadatas"][0]["document_id"]
+        if source_id == document_id:
+            return True
+        
+        source = self.collection.get(
+            where={"document_id": source_id},
+            include=["documents", "metadatas", "embeddings"]
+        )
+        
+        metadatas = [{**metadata, "document_id": document_id} for metadata in source["metadatas"]]
+        ids = [f"{document_id}_chunk_{metadata['chunk_index']}" for metadata in metadatas]
+        
+        self.collection.add(
+            documents=source["documents"],
+            embeddings=source["embeddings"],
+            metadatas=metadatas,
+            ids=ids
+        )
+        
+        return True
     
     async def search(self, query: str, document_id: str = None, top_k: int = 5) -> List[Dict[str, Any]]:
         """Search for relevant passages."""
@@ -99,6 +191,7 @@ class VectorStore:
         
         if results and results["ids"]:
             self.collection.delete(ids=results["ids"])
+            self.generation += 1
     
     def is_healthy(self) -> bool:
         """Check if vector store is operational."""
@@ -147,37 +240,46 @@ class VectorStore:
         elif extracted_data["type"] == "pdf":
             # Process PDF pages
             for page in extracted_data.get("pages", []):
-                if page["text"].strip():
-                    # Split long pages into smaller chunks
-                    page_chunks = self._split_text_into_chunks(page["text"])
-                    for i, chunk_text in enumerate(page_chunks):
-                        chunks.append({
-                            "text": chunk_text,
-                            "source": f"Page {page['page_number']}",
-                            "page_number": page['page_number']
-                        })
+                chunks.extend(self._page_chunks(page))
         
         return chunks
     
+    def _page_chunks(self, page: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Split a PDF page into chunks for indexing."""
+        if not page["text"].strip():
+            return []
+        
+        # Split long pages into smaller chunks
+        return [
+            {
+                "text": chunk_text,
+                "source": f"Page {page['page_number']}",
+                "page_number": page['page_number']
+            }
+            for chunk_text in self._split_text_into_chunks(page["text"])
+        ]
+    
     def _split_text_into_chunks(self, text: str, max_chunk_size: int = 1000) -> List[str]:
         """Split text into smaller chunks."""
         words = text.split()
+        joined = " ".join(words)
         chunks = []
-        current_chunk = []
+        chunk_start = 0  # Offset of the current chunk in `joined`
+        word_start = 0
         current_size = 0
         
         for word in words:
             word_size = len(word) + 1  # +1 for space
-            if current_size + word_size > max_chunk_size and current_chunk:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = [word]
+            if current_size + word_size > max_chunk_size and current_size:
+                chunks.append(joined[chunk_start:word_start - 1])
+                chunk_start = word_start
                 current_size = word_size
             else:
-                current_chunk.append(word)
                 current_size += word_size
+            word_start += word_size
         
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
+        if current_size:
+            chunks.append(joined[chunk_start:])
         
         return chunks
     
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional, List
+from typing import FrozenSet
 import os
 
 class Settings(BaseSettings):
@@ -7,6 +7,9 @@ class Settings(BaseSettings):
     api_title: str = "Brand Playbook Intelligence API"
     api_version: str = "2.0.0"
     api_prefix: str = "/api/v2"
+    debug: bool = os.getenv("DEBUG", "false").lower() == "true"
+    # Uvicorn worker processes when run via `python main.py` (ignored with DEBUG auto-reload)
+    web_concurrency: int = int(os.getenv("WEB_CONCURRENCY", "1"))
     
     # Security
     secret_key: str = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
@@ -16,15 +19,33 @@ class Settings(BaseSettings):
     # OpenAI
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     openai_model: str = "gpt-4-turbo-preview"
-    embedding_model: str = "text-embedding-ada-002"
+    # Tried first for answers; set OPENAI_FAST_MODEL= (empty) to always use openai_model
+    openai_fast_model: str = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+    # Questions whose best passage scores below this are answered without calling the model
+    min_passage_score_for_llm: float = float(os.getenv("MIN_PASSAGE_SCORE_FOR_LLM", "0.55"))
+    embedding_model: str = "text-embedding-3-small"
+    embedding_dimensions: int = 512
+    # Window in which concurrent query embeddings are merged into one request (0 disables waiting)
+    embedding_batch_window_ms: int = int(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "10"))
+    # SQLite file of previously computed embeddings, keyed by model, dimensions and text hash
+    embedding_cache_path: str = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
     
     # ChromaDB
     chroma_persist_directory: str = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
+    # HNSW graph parameters, fixed when a collection is created (Chroma copies them into the
+    # index then). Higher search_ef raises recall at the cost of query latency: ~200 is
+    # near-exact, ~40 is fastest; larger M/construction_ef build a bigger, better-connected graph
+    hnsw_m: int = int(os.getenv("HNSW_M", "24"))
+    hnsw_ef_construction: int = int(os.getenv("HNSW_EF_CONSTRUCTION", "128"))
+    hnsw_ef_search: int = int(os.getenv("HNSW_EF_SEARCH", "100"))
+    # Search results reused for near-duplicate queries (cosine similarity of query embeddings)
+    query_cache_size: int = 256
+    query_cache_similarity: float = float(os.getenv("QUERY_CACHE_SIMILARITY", "0.97"))
     
     # File Upload
     upload_directory: str = os.getenv("UPLOAD_DIRECTORY", "./uploads")
     max_upload_size: int = 50 * 1024 * 1024  # 50MB
-    allowed_extensions: List[str] = ["pdf", "pptx", "ppt", "docx", "doc"]
+    allowed_extensions: FrozenSet[str] = frozenset({"pdf", "pptx", "ppt", "docx", "doc"})
     
     # Frontend
     frontend_url: str = os.getenv("FRONTEND_URL", "http://localhost:5173")
@@ -32,9 +53,17 @@ class Settings(BaseSettings):
     # Document Processing
     chunk_size: int = 500
     chunk_overlap: int = 50
+    ocr_concurrency: int = int(os.getenv("OCR_CONCURRENCY", os.cpu_count() or 1))
+    ocr_queue_size: int = 8
+    document_cache_directory: str = os.getenv("DOCUMENT_CACHE_DIRECTORY", "./document_cache")
+    ingest_workers: int = int(os.getenv("INGEST_WORKERS", "4"))
     
     # Rate Limiting
     rate_limit: str = "10/minute"
+    # Shared counter storage, e.g. redis://localhost:6379/0, so limits hold across workers
+    rate_limit_storage_uri: str = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+    # Key limits on the first X-Forwarded-For hop; only enable behind a trusted proxy
+    trust_forwarded_for: bool = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
     
     # Logging
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
@@ -1,24 +1,210 @@
 import os
 import logging
-from typing import List, Dict, Optional
-import PyPDF2
-import pdfplumber
+import posixpath
+import threading
+import zipfile
+import multiprocessing
+from bisect import bisect_left, bisect_right
+from operator import add
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, chain, islice
+from typing import Iterator, List, Dict, Optional, Tuple
 import fitz  # PyMuPDF
-from pptx import Presentation
+from lxml import etree
 from docx import Document as DocxDocument
 from dataclasses import dataclass
 import re
-from PIL import Image
-import io
-import base64
 
 logger = logging.getLogger(__name__)
 
+_WHITESPACE_RE = re.compile(r'\s+')
+_SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+')
+
+# PresentationML parts are read straight from the .pptx package
+_OOXML_NS = {
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+}
+
+class _ThreadLocalXPath:
+    """An OOXML XPath expression compiled once per thread.
+    
+    lxml serializes calls on a shared XPath object with a lock, so uploads being
+    parsed on different worker threads would otherwise queue on each other.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+    
+    def __call__(self, element):
+        try:
+            xpath = self._local.xpath
+        except AttributeError:
+            xpath = self._local.xpath = etree.XPath(self.path, namespaces=_OOXML_NS)
+        return xpath(element)
+
+_A_BR = '{%s}br' % _OOXML_NS['a']
+_P_SP = '{%s}sp' % _OOXML_NS['p']
+_P_GRAPHIC_FRAME = '{%s}graphicFrame' % _OOXML_NS['p']
+_P_SP_TREE = '{%s}spTree' % _OOXML_NS['p']
+_R_ID = '{%s}id' % _OOXML_NS['r']
+_TXBODY_PARAGRAPHS = _ThreadLocalXPath('./a:p')
+_PARAGRAPH_TEXT_NODES = _ThreadLocalXPath('./a:r/a:t | ./a:br | ./a:fld/a:t')
+_SHAPE_TXBODY = _ThreadLocalXPath('./p:txBody')
+_SHAPE_PLACEHOLDER_TYPE = _ThreadLocalXPath('string(./p:nvSpPr/p:nvPr/p:ph/@type)')
+_FRAME_TABLE = _ThreadLocalXPath('./a:graphic/a:graphicData/a:tbl')
+_TABLE_ROWS = _ThreadLocalXPath('./a:tr')
+_TABLE_GRID_COLUMNS = _ThreadLocalXPath('./a:tblGrid/a:gridCol')
+_ROW_CELLS = _ThreadLocalXPath('./a:tc')
+_CELL_TXBODY = _ThreadLocalXPath('./a:txBody')
+_SLIDE_IDS = _ThreadLocalXPath('./p:sldIdLst/p:sldId')
+
+def _txbody_text(txbody) -> str:
+    """Read the text of a txBody element.
+    
+    Same result as python-pptx's ``text_frame.text``: paragraphs separated by
+    newlines, line breaks as vertical tabs.
+    """
+    return "\n".join(
+        "".join("\v" if node.tag == _A_BR else (node.text or "") for node in _PARAGRAPH_TEXT_NODES(paragraph))
+        for paragraph in _TXBODY_PARAGRAPHS(txbody)
+    )
+
+def _resolve_target(base: str, target: str) -> str:
+    """Resolve an internal relationship target to a part name in the zip archive.
+    
+    Absolute targets ("/ppt/slides/slide1.xml") are relative to the package root,
+    everything else to the directory of the source part.
+    """
+    if target.startswith('/'):
+        return posixpath.normpath(target.lstrip('/'))
+    return posixpath.normpath(posixpath.join(base, target))
+
+def _read_rels(archive: zipfile.ZipFile, part_name: str) -> Dict[str, Tuple[str, str]]:
+    """Map the relationship ids of a package part to (type, target).
+    
+    Internal targets are resolved to part names; external targets (hyperlinks,
+    linked media) are kept as written, as python-pptx's target_ref does.
+    """
+    base, name = posixpath.split(part_name)
+    try:
+        rels = etree.fromstring(archive.read(posixpath.join(base, '_rels', name + '.rels')))
+    except KeyError:
+        return {}
+    return {
+        rel.get('Id'): (
+            rel.get('Type'),
+            rel.get('Target') if rel.get('TargetMode') == 'External' else _resolve_target(base, rel.get('Target'))
+        )
+        for rel in rels
+    }
+
+def _slide_part_names(archive: zipfile.ZipFile) -> List[str]:
+    """Return the slide part names of a presentation in slide order"""
+    presentation_part = next(
+        target for rel_type, target in _read_rels(archive, '').values()
+        if rel_type.endswith('/officeDocument')
+    )
+    rels = _read_rels(archive, presentation_part)
+    presentation = etree.fromstring(archive.read(presentation_part))
+    return [rels[slide_id.get(_R_ID)][1] for slide_id in _SLIDE_IDS(presentation)]
+
+def _iter_slide_shapes(archive: zipfile.ZipFile, part_name: str) -> Iterator[etree._Element]:
+    """Stream the top-level text shapes and graphic frames of a slide part.
+    
+    Each shape is discarded once the caller has read it, so only one shape's
+    subtree is held in memory at a time.
+    """
+    with archive.open(part_name) as part:
+        for _, element in etree.iterparse(part, events=('end',), tag=(_P_SP, _P_GRAPHIC_FRAME)):
+            parent = element.getparent()
+            # Shapes nested in group shapes are skipped, as python-pptx's slide.shapes does
+            if parent.tag == _P_SP_TREE:
+                yield element
+                element.clear()
+                while element.getprevious() is not None:
+                    del parent[0]
+
+# Below this many pages per worker, process start-up outweighs parallel extraction
+PARALLEL_PDF_MIN_PAGES = 8
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    """Return the shared PDF extraction pool, starting it on first use"""
+    global _pdf_executor
+    if _pdf_executor is None:
+        # Spawned rather than forked: MuPDF state is not fork-safe and the
+        # parent may be extracting other documents on other threads
+        _pdf_executor = ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pdf_executor
+
+def _extract_pdf_pages(file_path: str, first_page: int, last_page: int) -> List[Tuple[int, str, List, List[Tuple[int, int, int]]]]:
+    """Extract (page_num, text, tables, images) for pages [first_page, last_page) of a PDF.
+    
+    Runs in worker processes, so it opens its own document handle.
+    """
+    pages = []
+    failures = 0
+    
+    def log_failure(what: str, page_num: int) -> None:
+        # Scanned or damaged PDFs can fail on every page: keep the first traceback
+        # and report the rest as one count at the end
+        nonlocal failures
+        failures += 1
+        if failures == 1:
+            logger.warning("Error extracting %s from page %d of %s", what, page_num + 1, file_path, exc_info=True)
+    
+    # A single PyMuPDF (C MuPDF bindings) handle serves text, tables and images
+    doc = fitz.open(file_path)
+    try:
+        for page_num in range(first_page, last_page):
+            page = doc[page_num]
+            
+            # Extract text
+            text = page.get_text("text")
+            
+            # Extract tables
+            try:
+                tables = [table.extract() for table in page.find_tables().tables]
+            except Exception:
+                log_failure("tables", page_num)
+                tables = []
+            
+            # Extract images: sizes and colour components come from the page's
+            # image metadata, so no pixel data is decoded
+            images = []
+            try:
+                components = {info["xref"]: info["colorspace"] for info in page.get_image_info(xrefs=True)}
+                for img_index, img in enumerate(page.get_images()):
+                    xref, width, height = img[0], img[2], img[3]
+                    if components.get(xref, 4) < 4:  # GRAY or RGB
+                        images.append((img_index, width, height))
+            except Exception:
+                log_failure("images", page_num)
+            
+            pages.append((page_num, text, tables, images))
+    finally:
+        doc.close()
+    
+    if failures > 1:
+        logger.warning("%d table/image extraction errors on pages %d-%d of %s", failures, first_page + 1, last_page, file_path)
+    
+    return pages
+
 @dataclass
 class DocumentChunk:
+    # Declared slots (dataclass(slots=True) needs Python 3.10) drop the per-instance __dict__
+    __slots__ = ('content', 'page_number', 'chunk_type', 'metadata')
+    
     content: str
     page_number: int
-    chunk_type: str  # 'text', 'table', 'title', 'image_description'
+    chunk_type: str  # 'text', 'table', 'title'
     metadata: Dict
 
 class DocumentProcessor:
@@ -44,81 +230,55 @@ class DocumentProcessor:
             raise
     
     def process_pdf_advanced(self, file_path: str) -> List[DocumentChunk]:
-        """Advanced PDF processing with table and image extraction"""
+        """Advanced PDF processing with table extraction; images are counted per page"""
         chunks = []
         
-        # Try multiple PDF processing methods for robustness
-        try:
-            # Method 1: Use pdfplumber for better table extraction
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    # Extract text
-                    text = page.extract_text()
-                    if text and text.strip():
-                        text_chunks = self._create_chunks(
-                            text, 
-                            page_num + 1, 
-                            'pdf_text'
-                        )
-                        chunks.extend(text_chunks)
-                    
-                    # Extract tables
-                    tables = page.extract_tables()
-                    for i, table in enumerate(tables):
-                        if table:
-                            table_text = self._format_table(table)
-                            chunks.append(DocumentChunk(
-                                content=table_text,
-                                page_number=page_num + 1,
-                                chunk_type='table',
-                                metadata={
-                                    'table_index': i,
-                                    'rows': len(table),
-                                    'columns': len(table[0]) if table else 0
-                                }
-                            ))
-        except Exception as e:
-            logger.warning(f"pdfplumber failed, trying PyMuPDF: {e}")
+        with fitz.open(file_path) as doc:
+            page_count = len(doc)
+        
+        # Pages are independent, so larger PDFs are split into one contiguous
+        # page range per worker process
+        workers = min(os.cpu_count() or 1, page_count // PARALLEL_PDF_MIN_PAGES)
+        if workers > 1:
+            step = -(-page_count // workers)
+            first_pages = range(0, page_count, step)
+            results = _get_pdf_executor().map(
+                _extract_pdf_pages,
+                [file_path] * len(first_pages),
+                first_pages,
+                [min(first + step, page_count) for first in first_pages]
+            )
+            pages = [page for result in results for page in result]
+        else:
+            pages = _extract_pdf_pages(file_path, 0, page_count)
+        
+        for page_num, text, tables, images in pages:
+            first_chunk = len(chunks)
+            if text.strip():
+                chunks.extend(self._iter_chunks(
+                    text,
+                    page_num + 1,
+                    'pdf_text'
+                ))
             
-            # Method 2: Use PyMuPDF for better image handling
-            doc = fitz.open(file_path)
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                
-                # Extract text
-                text = page.get_text()
-                if text.strip():
-                    text_chunks = self._create_chunks(
-                        text,
-                        page_num + 1,
-                        'pdf_text'
-                    )
-                    chunks.extend(text_chunks)
-                
-                # Extract images
-                image_list = page.get_images()
-                for img_index, img in enumerate(image_list):
-                    try:
-                        # Get image data
-                        xref = img[0]
-                        pix = fitz.Pixmap(doc, xref)
-                        if pix.n - pix.alpha < 4:  # GRAY or RGB
-                            img_data = pix.tobytes("png")
-                            chunks.append(DocumentChunk(
-                                content=f"[Image on page {page_num + 1}]",
-                                page_number=page_num + 1,
-                                chunk_type='image_description',
-                                metadata={
-                                    'image_index': img_index,
-                                    'width': pix.width,
-                                    'height': pix.height,
-                                    'has_image': True
-                                }
-                            ))
-                    except Exception as e:
-                        logger.warning(f"Error extracting image: {e}")
+            for i, table in enumerate(tables):
+                if table:
+                    table_text = self._format_table(table)
+                    chunks.append(DocumentChunk(
+                        content=table_text,
+                        page_number=page_num + 1,
+                        chunk_type='table',
+                        metadata={
+                            'table_index': i,
+                            'rows': len(table),
+                            'columns': len(table[0]) if table else 0
+                        }
+                    ))
             
-            doc.close()
+            # Images have no text to embed, so they are only noted on the page's chunks
+            if images:
+                for chunk in chunks[first_chunk:]:
+                    chunk.metadata['image_count'] = len(images)
         
         return chunks
     
@@ -146,12 +306,11 @@ class DocumentProcessor:
         
         # Create chunks from full text
         if full_text:
-            text_chunks = self._create_chunks(
+            chunks.extend(self._iter_chunks(
                 "\n".join(full_text),
                 1,
                 'word_text'
-            )
-            chunks.extend(text_chunks)
+            ))
         
         # Extract tables
         for table_num, table in enumerate(doc.tables):
@@ -177,117 +336,176 @@ class DocumentProcessor:
     def process_powerpoint(self, file_path: str) -> List[DocumentChunk]:
         """Extract content from PowerPoint files with improved handling"""
         chunks = []
-        presentation = Presentation(file_path)
         
-        for slide_num, slide in enumerate(presentation.slides):
-            slide_content = []
-            
-            # Extract slide title
-            if slide.shapes.title:
-                title = slide.shapes.title.text
-                if title:
-                    chunks.append(DocumentChunk(
-                        content=title,
-                        page_number=slide_num + 1,
-                        chunk_type='title',
-                        metadata={'slide_number': slide_num + 1}
-                    ))
-            
-            # Extract text from all shapes
-            for shape in slide.shapes:
-                if hasattr(shape, "text") and shape.text:
-                    slide_content.append(shape.text)
+        # Slides are streamed from the package one at a time, so memory follows the
+        # largest slide rather than the whole deck's object model
+        with zipfile.ZipFile(file_path) as archive:
+            for slide_num, slide_part in enumerate(_slide_part_names(archive)):
+                slide_content = []
+                has_title = False
                 
-                # Extract table content
-                if shape.has_table:
-                    table_data = []
-                    for row in shape.table.rows:
-                        row_data = [cell.text for cell in row.cells]
-                        table_data.append(row_data)
+                for shape in _iter_slide_shapes(archive, slide_part):
+                    # Extract table content
+                    if shape.tag == _P_GRAPHIC_FRAME:
+                        tables = _FRAME_TABLE(shape)
+                        if tables:
+                            rows = _TABLE_ROWS(tables[0])
+                            table_data = []
+                            for row in rows:
+                                row_data = []
+                                for cell in _ROW_CELLS(row):
+                                    cell_txbody = _CELL_TXBODY(cell)
+                                    row_data.append(_txbody_text(cell_txbody[0]) if cell_txbody else "")
+                                table_data.append(row_data)
+                            
+                            table_text = self._format_table(table_data)
+                            chunks.append(DocumentChunk(
+                                content=table_text,
+                                page_number=slide_num + 1,
+                                chunk_type='table',
+                                metadata={
+                                    'slide_number': slide_num + 1,
+                                    'rows': len(rows),
+                                    'columns': len(_TABLE_GRID_COLUMNS(tables[0]))
+                                }
+                            ))
+                        continue
                     
-                    table_text = self._format_table(table_data)
-                    chunks.append(DocumentChunk(
-                        content=table_text,
-                        page_number=slide_num + 1,
-                        chunk_type='table',
-                        metadata={
-                            'slide_number': slide_num + 1,
-                            'rows': len(shape.table.rows),
-                            'columns': len(shape.table.columns)
-                        }
-                    ))
-            
-            # Extract notes
-            if slide.has_notes_slide and slide.notes_slide.notes_text_frame.text:
-                slide_content.append(f"Speaker Notes: {slide.notes_slide.notes_text_frame.text}")
-            
-            # Create chunks from slide content
-            if slide_content:
-                full_text = "\n".join(slide_content)
-                slide_chunks = self._create_chunks(
-                    full_text,
-                    slide_num + 1,
-                    'slide_content'
+                    # Extract text from all shapes
+                    txbody = _SHAPE_TXBODY(shape)
+                    if not txbody:
+                        continue
+                    text = _txbody_text(txbody[0])
+                    
+                    # Extract slide title (the first title placeholder)
+                    if not has_title and _SHAPE_PLACEHOLDER_TYPE(shape) in ('title', 'ctrTitle'):
+                        has_title = True
+                        if text:
+                            chunks.append(DocumentChunk(
+                                content=text,
+                                page_number=slide_num + 1,
+                                chunk_type='title',
+                                metadata={'slide_number': slide_num + 1}
+                            ))
+                    
+                    if text:
+                        slide_content.append(text)
+                
+                # Extract notes from the notes slide's body placeholder
+                notes_part = next(
+                    (target for rel_type, target in _read_rels(archive, slide_part).values()
+                     if rel_type.endswith('/notesSlide')),
+                    None
                 )
-                chunks.extend(slide_chunks)
+                if notes_part:
+                    notes_text = next(
+                        (_txbody_text(_SHAPE_TXBODY(shape)[0])
+                         for shape in _iter_slide_shapes(archive, notes_part)
+                         if _SHAPE_PLACEHOLDER_TYPE(shape) == 'body' and _SHAPE_TXBODY(shape)),
+                        ""
+                    )
+                    if notes_text:
+                        slide_content.append(f"Speaker Notes: {notes_text}")
+                
+                # Create chunks from slide content
+                if slide_content:
+                    full_text = "\n".join(slide_content)
+                    chunks.extend(self._iter_chunks(
+                        full_text,
+                        slide_num + 1,
+                        'slide_content'
+                    ))
         
         return chunks
     
     def _create_chunks(self, text: str, page_number: int, chunk_type: str) -> List[DocumentChunk]:
         """Split text into overlapping chunks with improved handling"""
-        chunks = []
-        
+        return list(self._iter_chunks(text, page_number, chunk_type))
+    
+    def _iter_chunks(self, text: str, page_number: int, chunk_type: str) -> Iterator[DocumentChunk]:
+        """Yield overlapping chunks of text without building an intermediate list"""
         # Clean text
-        text = re.sub(r'\s+', ' ', text.strip())
-        words = text.split()
+        text = _WHITESPACE_RE.sub(' ', text.strip())
         
-        if len(words) <= self.chunk_size:
-            # If text is small enough, return as single chunk
-            chunks.append(DocumentChunk(
+        # The cleaned text is single-spaced, so small texts are counted without splitting
+        word_count = text.count(' ') + 1 if text else 0
+        if word_count <= self.chunk_size:
+            # If text is small enough, yield it as a single chunk
+            yield DocumentChunk(
                 content=text,
                 page_number=page_number,
                 chunk_type=chunk_type,
-                metadata={'word_count': len(words)}
-            ))
-            return chunks
+                metadata={'word_count': word_count}
+            )
+            return
+        
+        words = text.split()
+        word_total = len(words)
+        
+        # Word k of the single-spaced text starts at word_starts[k] (its letters_before
+        # plus one space per preceding word), so each chunk is one slice of it rather
+        # than a re-join of a word sublist. Both passes run in C via accumulate/map.
+        letters_before = accumulate(map(len, words), initial=0)
+        word_starts = list(map(add, letters_before, range(word_total + 1)))
         
-        # Create overlapping chunks
-        for i in range(0, len(words), self.chunk_size - self.chunk_overlap):
-            chunk_words = words[i:i + self.chunk_size]
-            chunk_text = " ".join(chunk_words)
+        # Word indexes where a sentence starts, plus the end of the text
+        boundaries = [bisect_left(word_starts, match.end()) for match in _SENTENCE_BOUNDARY_RE.finditer(text)]
+        boundaries.append(word_total)
+        
+        # Pack whole sentences into overlapping windows that each reach past the
+        # previous one. A sentence end is only used if it fills at least half the
+        # window (or ends the text); otherwise the cut falls at chunk_size words, so a
+        # short sentence followed by unpunctuated text cannot yield a tiny chunk
+        min_words = max(self.chunk_size // 2, 1)
+        start = 0
+        end = 0
+        chunk_index = 0
+        while True:
+            last = bisect_right(boundaries, start + self.chunk_size) - 1
+            boundary = boundaries[last] if last >= 0 else 0
+            if boundary > end and (boundary - start >= min_words or boundary == word_total):
+                end = boundary
+            else:
+                end = min(start + self.chunk_size, word_total)
             
-            chunks.append(DocumentChunk(
-                content=chunk_text,
+            yield DocumentChunk(
+                content=text[word_starts[start]:word_starts[end] - 1],
                 page_number=page_number,
                 chunk_type=chunk_type,
                 metadata={
-                    'word_count': len(chunk_words),
-                    'chunk_index': i // (self.chunk_size - self.chunk_overlap),
-                    'start_word': i,
-                    'end_word': min(i + self.chunk_size, len(words))
+                    'word_count': end - start,
+                    'chunk_index': chunk_index,
+                    'start_word': start,
+                    'end_word': end
                 }
-            ))
+            )
             
-            if i + self.chunk_size >= len(words):
+            if end >= word_total:
                 break
-        
-        return chunks
+            chunk_index += 1
+            
+            # Start the next window at the last sentence that keeps at least
+            # chunk_overlap (and at most twice that) words of overlap, or mid-sentence
+            # if none does
+            overlap_start = end - self.chunk_overlap
+            last = bisect_right(boundaries, overlap_start) - 1
+            if last >= 0 and boundaries[last] > start and boundaries[last] >= end - 2 * self.chunk_overlap:
+                start = boundaries[last]
+            elif overlap_start > start:
+                start = overlap_start
+            else:
+                start = end
     
     def _format_table(self, table_data: List[List[str]]) -> str:
         """Format table data as markdown"""
         if not table_data:
             return ""
         
-        # Create markdown table
-        lines = []
-        
-        # Header
-        if len(table_data) > 0:
-            lines.append("| " + " | ".join(str(cell) for cell in table_data[0]) + " |")
-            lines.append("|" + "---|" * len(table_data[0]))
-        
-        # Rows
-        for row in table_data[1:]:
-            lines.append("| " + " | ".join(str(cell) for cell in row) + " |")
+        # Create markdown table: header, separator, then rows
+        header = table_data[0]
+        lines = chain(
+            ("| " + " | ".join(map(str, header)) + " |", "|" + "---|" * len(header)),
+            ("| " + " | ".join(map(str, row)) + " |" for row in islice(table_data, 1, None))
+        )
         
         return "\n".join(lines)
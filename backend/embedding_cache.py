@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """Persistent embedding store so identical text is only ever embedded once per model.
+
+    Keys are sha256 digests of model, dimensions and text; values are float32 blobs
+    (2 KB for a 512-dimension vector). Repeated boilerplate such as slide footers and
+    re-uploaded playbooks skip the embeddings API entirely.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def key(model: str, dimensions: int, text: str) -> bytes:
+        return hashlib.sha256(f"{model}:{dimensions}:{text}".encode("utf-8")).digest()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Return cached vectors for whichever of `keys` are present"""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay under SQLite's default bound-parameter limit
+            for start in range(0, len(unique_keys), 900):
+                batch = unique_keys[start:start + 900]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                )
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def set_many(self, items: Dict[bytes, np.ndarray]):
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+        try:
+            with self._lock, self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows
+                )
+        except sqlite3.Error as e:
+            # A cache write failure must never fail the embedding call itself
+            logger.warning(f"Could not persist {len(rows)} embeddings: {e}")
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide cache, opened on first use so importing never touches the disk"""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(settings.embedding_cache_path)
+        return _embedding_cache
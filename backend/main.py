@@ -1,14 +1,26 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request, status, Header
+from fastapi import APIRouter, FastAPI, File, UploadFile, HTTPException, Depends, Request, status, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from starlette.datastructures import Headers
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Annotated
+from typing import Iterator, List, Optional, Dict, Annotated, Union
 import os
+import sys
 import uuid
-from datetime import datetime, timedelta
+import time
+import hashlib
+import json
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-import shutil
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import aiofiles
+from cachetools import TTLCache
 
 # Import configuration and modules
 from config import settings
@@ -19,26 +31,117 @@ from auth import (
 )
 from document_processor import DocumentProcessor
 from vector_store import VectorStore
+from playbook_metadata import get_playbook_metadata_store
 from qa_engine import QAEngine
+from openai_clients import create_openai_client
 
 # Rate limiting
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build long-lived components once per process and release them on shutdown"""
+    logger.info(f"Starting {settings.api_title} v{settings.api_version}")
+    logger.info(f"Upload directory: {settings.upload_directory}")
+    logger.info(f"ChromaDB directory: {settings.chroma_persist_directory}")
+    
+    # Create necessary directories
+    Path(settings.upload_directory).mkdir(parents=True, exist_ok=True)
+    Path(settings.chroma_persist_directory).mkdir(parents=True, exist_ok=True)
+    Path("logs").mkdir(exist_ok=True)
+    
+    # Initialize components
+    app.state.doc_processor = DocumentProcessor(
+        chunk_size=settings.chunk_size,
+        chunk_overlap=settings.chunk_overlap
+    )
+    # Dedicated pool for upload ingestion so long parses and embedding calls
+    # never starve the loop's default executor
+    app.state.ingest_executor = ThreadPoolExecutor(
+        max_workers=settings.ingest_workers,
+        thread_name_prefix="ingest"
+    )
+    
+    # Build the server-key store up front so any legacy migration starts with the process
+    if settings.openai_api_key:
+        try:
+            await asyncio.to_thread(get_vector_store, settings.openai_api_key)
+        except Exception as e:
+            logger.error(f"Vector store initialization failed: {e}")
+    
+    yield
+    
+    logger.info("Shutting down application")
+    app.state.ingest_executor.shutdown(wait=True)
+
 # Initialize FastAPI app
 app = FastAPI(
     title=settings.api_title,
     version=settings.api_version,
     docs_url=f"{settings.api_prefix}/docs",
-    redoc_url=f"{settings.api_prefix}/redoc"
+    redoc_url=f"{settings.api_prefix}/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
+# All API routes share the versioned prefix
+router = APIRouter(prefix=settings.api_prefix)
+
+# Authenticated user, resolved once per request
+CurrentUser = Annotated[User, Depends(get_current_active_user)]
+
 # Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+def get_client_address(request: Request) -> str:
+    """Identify the client for rate limiting, honouring a trusted proxy's X-Forwarded-For"""
+    if settings.trust_forwarded_for:
+        forwarded_for = request.headers.get("x-forwarded-for")
+        if forwarded_for:
+            return forwarded_for.split(",", 1)[0].strip()
+    return get_remote_address(request)
+
+limiter = Limiter(
+    key_func=get_client_address,
+    storage_uri=settings.rate_limit_storage_uri,
+    strategy="moving-window",
+    in_memory_fallback_enabled=True
+)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Bytes of multipart framing (boundaries, part headers, filename) allowed on top of the file
+UPLOAD_MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadSizeLimitMiddleware:
+    """Reject uploads whose declared Content-Length is over the limit before any body is read.
+
+    Form parsing spools the whole body before the route runs, so the check cannot live in
+    the handler or a dependency. Bodies without a usable Content-Length are still bounded
+    by the exact size check in upload_playbook.
+    """
+
+    def __init__(self, app, path: str, max_body_size: int):
+        self.app = app
+        self.path = path
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == self.path:
+            content_length = Headers(scope=scope).get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > self.max_body_size:
+                response = ORJSONResponse({"detail": UPLOAD_TOO_LARGE_MESSAGE}, status_code=413)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Added before CORS so that its 413s still carry the CORS headers
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    path=f"{settings.api_prefix}/upload",
+    max_body_size=settings.max_upload_size + UPLOAD_MULTIPART_OVERHEAD
+)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -48,14 +151,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize components
-doc_processor = DocumentProcessor(
-    chunk_size=settings.chunk_size,
-    chunk_overlap=settings.chunk_overlap
-)
+# Compress larger JSON payloads (answers with passages, playbook lists, stats)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Uploads are written to disk in chunks of this size rather than read into memory
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Error messages and bodies that only depend on settings, built once at import
+UPLOAD_TOO_LARGE_MESSAGE = f"File size exceeds maximum allowed size of {settings.max_upload_size // (1024*1024)}MB"
+FILE_TYPE_NOT_ALLOWED_MESSAGE = f"File type not allowed. Allowed types: {', '.join(sorted(settings.allowed_extensions))}"
+API_KEY_REQUIRED_MESSAGE = "OpenAI API key required. Please provide via X-API-Key header."
+INTERNAL_ERROR_CONTENT = {"detail": "An internal error occurred. Please try again later."}
+
+def uuid7() -> uuid.UUID:
+    """Time-ordered UUID (RFC 9562 version 7): 48-bit millisecond timestamp followed by random bits"""
+    value = ((time.time_ns() // 1_000_000) << 80) | int.from_bytes(os.urandom(10), "big")
+    value = (value & ~(0xF << 76)) | (0x7 << 76)  # version 7
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)  # RFC 4122 variant
+    return uuid.UUID(int=value)
+
+# Linux can sendfile between two regular files, letting the kernel copy uploads
+# that Starlette has already spooled to a temporary file
+SENDFILE_UPLOADS = sys.platform.startswith("linux")
+
+def copy_spooled_upload(src_fd: int, file_path: str, file_size: int) -> None:
+    """Copy a rolled-over upload spool to file_path without passing the bytes through Python"""
+    with open(file_path, "wb") as out:
+        offset = 0
+        while offset < file_size:
+            sent = os.sendfile(out.fileno(), src_fd, offset, file_size - offset)
+            if not sent:
+                break
+            offset += sent
+
+# Vector store and QA engine are expensive to build (Chroma client, OpenAI client),
+# so keep one instance per API key for the life of the process
+@lru_cache(maxsize=16)
+def get_vector_store(api_key: str) -> VectorStore:
+    vector_store = VectorStore(api_key=api_key)
+    # Pre-v2 chunks are re-embedded off the request path; searches fall back to them meanwhile
+    if vector_store.legacy_collection is not None:
+        threading.Thread(
+            target=vector_store.migrate_legacy_collection, name="legacy-migration", daemon=True
+        ).start()
+    return vector_store
 
-# Ensure upload directory exists
-os.makedirs(settings.upload_directory, exist_ok=True)
+@lru_cache(maxsize=16)
+def get_qa_engine(api_key: str) -> QAEngine:
+    return QAEngine(get_vector_store(api_key), api_key=api_key)
 
 # Request/Response models
 class QuestionRequest(BaseModel):
@@ -63,9 +206,15 @@ class QuestionRequest(BaseModel):
     playbook_id: Optional[str] = None
     conversation_history: Optional[List[Dict]] = None
 
+class Passage(BaseModel):
+    content: str
+    page_number: Union[int, str]
+    chunk_type: str
+    score: float
+
 class QuestionResponse(BaseModel):
     answer: str
-    passages: List[dict]
+    passages: List[Passage]
     confidence: float
     tokens_used: int
     follow_up_questions: List[str] = []
@@ -77,8 +226,17 @@ class UploadResponse(BaseModel):
     message: str
     chunk_count: int
 
+class PlaybookSummary(BaseModel):
+    id: str
+    filename: Optional[str] = None
+    file_type: Optional[str] = None
+    file_size: Optional[int] = None
+    uploaded_by: Optional[str] = None
+    created_at: Optional[str] = None
+    chunk_count: int = 0
+
 class PlaybookListResponse(BaseModel):
-    playbooks: List[Dict]
+    playbooks: List[PlaybookSummary]
     total: int
     page: int
     page_size: int
@@ -96,15 +254,47 @@ class ApiKeyValidationResponse(BaseModel):
     message: str
     model: Optional[str] = None
 
+# Validated API keys -> model name, keyed by SHA-256 so raw keys are never held here
+_validated_api_keys: TTLCache = TTLCache(maxsize=128, ttl=300)
+
+# Recent /ask results; keys carry the shared index generation, so uploads and deletes in
+# any worker retire them, and this worker also clears them on its own changes
+_answer_cache: TTLCache = TTLCache(maxsize=10_000, ttl=600)
+
+class _AnswerLock:
+    """Lock shared by identical in-flight questions, counting the requests holding or awaiting it"""
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+_answer_locks: Dict[str, _AnswerLock] = {}
+
+def _answer_cache_key(question_request: QuestionRequest) -> str:
+    """Digest of the index generation, normalized question, playbook and conversation history"""
+    payload = json.dumps(
+        [
+            get_playbook_metadata_store().generation(),
+            " ".join(question_request.question.split()).lower(),
+            question_request.playbook_id,
+            question_request.conversation_history or []
+        ],
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
 # Helper function to get API key
-def get_api_key(x_api_key: Annotated[Optional[str], Header()] = None) -> Optional[str]:
-    """Get API key from header or fall back to environment variable"""
-    if x_api_key:
-        return x_api_key
-    return settings.openai_api_key
+def require_api_key(x_api_key: Annotated[Optional[str], Header()] = None) -> str:
+    """Get API key from header or fall back to environment variable, rejecting the request if neither is set"""
+    api_key = x_api_key or settings.openai_api_key
+    if not api_key:
+        raise HTTPException(400, API_KEY_REQUIRED_MESSAGE)
+    return api_key
 
 # Authentication endpoint
-@app.post(f"{settings.api_prefix}/auth/login", response_model=Token)
+@router.post("/auth/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """Authenticate user and return access token"""
     user = authenticate_user(form_data.username, form_data.password)
@@ -121,24 +311,29 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     return {"access_token": access_token, "token_type": "bearer"}
 
 # API Key validation endpoint
-@app.post(f"{settings.api_prefix}/validate-api-key", response_model=ApiKeyValidationResponse)
+@router.post("/validate-api-key", response_model=ApiKeyValidationResponse)
 @limiter.limit("10/minute")
 async def validate_api_key(
     request: Request,
-    api_key: str = Field(..., description="OpenAI API key to validate"),
-    current_user: User = Depends(get_current_active_user)
+    current_user: CurrentUser,
+    api_key: str = Field(..., description="OpenAI API key to validate")
 ):
     """Validate an OpenAI API key"""
-    import openai
+    
+    key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+    model_name = _validated_api_keys.get(key_hash)
+    if model_name:
+        return ApiKeyValidationResponse(valid=True, message="API key is valid", model=model_name)
     
     try:
         # Test the API key by making a simple request
-        client = openai.OpenAI(api_key=api_key)
-        models = client.models.list()
+        client = create_openai_client(api_key)
+        models = await asyncio.to_thread(client.models.list)
         
-        # Check if GPT-4 is available
-        gpt4_available = any("gpt-4" in model.id for model in models.data)
-        model_name = "gpt-4-turbo-preview" if gpt4_available else "gpt-3.5-turbo"
+        # Check if GPT-4 is available, stopping at the first match
+        gpt4_model = next((model for model in models.data if "gpt-4" in model.id), None)
+        model_name = "gpt-4-turbo-preview" if gpt4_model else "gpt-3.5-turbo"
+        _validated_api_keys[key_hash] = model_name
         
         return ApiKeyValidationResponse(
             valid=True,
@@ -153,13 +348,13 @@ async def validate_api_key(
         )
 
 # Health check endpoint
-@app.get(f"{settings.api_prefix}/health", response_model=HealthResponse)
+@router.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
     try:
         # Initialize vector store with default API key for health check
-        vector_store = VectorStore(api_key=settings.openai_api_key)
-        stats = vector_store.get_statistics()
+        vector_store = get_vector_store(settings.openai_api_key)
+        stats = await asyncio.to_thread(vector_store.get_statistics)
         return HealthResponse(
             status="healthy",
             version=settings.api_version,
@@ -179,49 +374,54 @@ async def root():
         "docs": f"{settings.api_prefix}/docs"
     }
 
-@app.post(f"{settings.api_prefix}/upload", response_model=UploadResponse)
+@router.post("/upload", response_model=UploadResponse)
 @limiter.limit("5/minute")
 async def upload_playbook(
     request: Request,
+    current_user: CurrentUser,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_active_user),
-    api_key: Optional[str] = Depends(get_api_key)
+    api_key: str = Depends(require_api_key)
 ):
     """Upload and process a brand playbook (PDF, PowerPoint, or Word)"""
-    if not api_key:
-        raise HTTPException(400, "OpenAI API key required. Please provide via X-API-Key header.")
-    
-    # Validate file size
-    file_size = 0
-    file_content = await file.read()
-    file_size = len(file_content)
-    
-    if file_size > settings.max_upload_size:
-        raise HTTPException(400, f"File size exceeds maximum allowed size of {settings.max_upload_size // (1024*1024)}MB")
-    
-    # Reset file pointer
-    await file.seek(0)
-    
     # Validate file extension
-    file_extension = file.filename.split(".")[-1].lower()
-    if file_extension not in settings.allowed_extensions:
-        raise HTTPException(400, f"File type not allowed. Allowed types: {settings.allowed_extensions}")
+    file_extension = Path(file.filename or "").suffix[1:].lower()
+    if not file_extension or file_extension not in settings.allowed_extensions:
+        raise HTTPException(400, FILE_TYPE_NOT_ALLOWED_MESSAGE)
     
-    # Generate unique ID for this playbook
-    playbook_id = str(uuid.uuid4())
+    # Generate unique, time-ordered ID for this playbook; existing v4 IDs remain valid
+    playbook_id = str(uuid7())
     
     # Save uploaded file
     file_path = os.path.join(settings.upload_directory, f"{playbook_id}.{file_extension}")
     
     try:
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        if SENDFILE_UPLOADS and getattr(file.file, "_rolled", False):
+            # Large uploads are already on disk in the spool; size-check it and copy kernel-side
+            src_fd = file.file.fileno()
+            file_size = os.fstat(src_fd).st_size
+            if file_size > settings.max_upload_size:
+                raise HTTPException(413, UPLOAD_TOO_LARGE_MESSAGE)
+            await asyncio.to_thread(copy_spooled_upload, src_fd, file_path, file_size)
+        else:
+            # Stream the upload to disk, enforcing the size limit as chunks arrive
+            file_size = 0
+            async with aiofiles.open(file_path, "wb") as f:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    file_size += len(chunk)
+                    if file_size > settings.max_upload_size:
+                        raise HTTPException(413, UPLOAD_TOO_LARGE_MESSAGE)
+                    await f.write(chunk)
         
         logger.info(f"Processing document: {file.filename} (ID: {playbook_id})")
         
-        # Process document
-        extracted_content = doc_processor.process_document(file_path, file_extension)
+        # Process document on the ingestion pool so the event loop keeps serving requests;
+        # PDF page extraction fans out further to the processor's own process pool
+        loop = asyncio.get_running_loop()
+        ingest_executor = request.app.state.ingest_executor
+        extracted_content = await loop.run_in_executor(
+            ingest_executor,
+            request.app.state.doc_processor.process_document, file_path, file_extension
+        )
         
         # Prepare metadata
         metadata = {
@@ -229,78 +429,130 @@ async def upload_playbook(
             "file_type": file_extension,
             "file_size": file_size,
             "uploaded_by": current_user.username,
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
         }
         
         # Store in vector database with provided API key
-        vector_store = VectorStore(api_key=api_key)
-        vector_store.add_documents(playbook_id, extracted_content, metadata)
+        vector_store = get_vector_store(api_key)
+        chunk_count = await loop.run_in_executor(
+            ingest_executor, vector_store.add_documents, playbook_id, extracted_content, metadata
+        )
+        _answer_cache.clear()
         
         return UploadResponse(
             playbook_id=playbook_id,
             filename=file.filename,
             status="success",
-            message=f"Successfully processed {len(extracted_content)} content chunks",
-            chunk_count=len(extracted_content)
+            message=f"Successfully processed {chunk_count} content chunks",
+            chunk_count=chunk_count
         )
         
+    except HTTPException:
+        Path(file_path).unlink(missing_ok=True)
+        raise
     except Exception as e:
         # Clean up on error
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        Path(file_path).unlink(missing_ok=True)
         logger.error(f"Error processing document: {e}")
         raise HTTPException(500, f"Error processing document: {str(e)}")
 
-@app.post(f"{settings.api_prefix}/ask", response_model=QuestionResponse)
+@router.post("/ask", response_model=QuestionResponse)
 @limiter.limit(settings.rate_limit)
 async def ask_question(
     request: Request,
     question_request: QuestionRequest,
-    current_user: User = Depends(get_current_active_user),
-    api_key: Optional[str] = Depends(get_api_key)
+    current_user: CurrentUser,
+    api_key: str = Depends(require_api_key)
 ):
     """Ask a question about the brand playbook"""
-    if not api_key:
-        raise HTTPException(400, "OpenAI API key required. Please provide via X-API-Key header.")
-    
     try:
         logger.info(f"User {current_user.username} asking: {question_request.question}")
         
-        # Initialize components with provided API key
-        vector_store = VectorStore(api_key=api_key)
-        qa_engine = QAEngine(vector_store, api_key=api_key)
+        cache_key = _answer_cache_key(question_request)
+        result = _answer_cache.get(cache_key)
+        if result is not None:
+            return result
         
-        result = qa_engine.answer_question(
-            question=question_request.question,
-            playbook_id=question_request.playbook_id,
-            conversation_history=question_request.conversation_history
-        )
+        # Identical questions in flight wait for the first one instead of repeating the work
+        answer_lock = _answer_locks.get(cache_key)
+        if answer_lock is None:
+            answer_lock = _answer_locks[cache_key] = _AnswerLock()
+        answer_lock.users += 1
+        try:
+            async with answer_lock.lock:
+                result = _answer_cache.get(cache_key)
+                if result is None:
+                    # Reuse components cached for the provided API key
+                    qa_engine = get_qa_engine(api_key)
+                    
+                    result = await asyncio.to_thread(
+                        qa_engine.answer_question,
+                        question=question_request.question,
+                        playbook_id=question_request.playbook_id,
+                        conversation_history=question_request.conversation_history
+                    )
+                    _answer_cache[cache_key] = result
+        finally:
+            # The last request out removes the lock; earlier ones leave it to those still waiting
+            answer_lock.users -= 1
+            if not answer_lock.users and _answer_locks.get(cache_key) is answer_lock:
+                del _answer_locks[cache_key]
         return result
     except Exception as e:
         logger.error(f"Error answering question: {e}")
         raise HTTPException(500, f"Error answering question: {str(e)}")
 
-@app.get(f"{settings.api_prefix}/playbooks", response_model=PlaybookListResponse)
+def _sse_events(events: Iterator[Dict]) -> Iterator[str]:
+    """Encode QA stream events as Server-Sent Events, ending with an error event on failure"""
+    try:
+        for event in events:
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    except Exception as e:
+        logger.error(f"Error streaming answer: {e}")
+        yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': f'Error answering question: {str(e)}'})}\n\n"
+
+@router.post("/ask/stream")
+@limiter.limit(settings.rate_limit)
+async def ask_question_stream(
+    request: Request,
+    question_request: QuestionRequest,
+    current_user: CurrentUser,
+    api_key: str = Depends(require_api_key)
+):
+    """Ask a question and receive the answer as Server-Sent Events while it is generated"""
+    logger.info(f"User {current_user.username} asking (streamed): {question_request.question}")
+    
+    events = get_qa_engine(api_key).stream_answer(
+        question=question_request.question,
+        playbook_id=question_request.playbook_id,
+        conversation_history=question_request.conversation_history
+    )
+    # Starlette iterates the sync generator on a worker thread; declaring an identity
+    # encoding keeps GZipMiddleware from buffering the events
+    return StreamingResponse(
+        _sse_events(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Content-Encoding": "identity", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/playbooks", response_model=PlaybookListResponse)
 @limiter.limit("30/minute")
 async def list_playbooks(
     request: Request,
+    current_user: CurrentUser,
     page: int = 1,
     page_size: int = 10,
-    current_user: User = Depends(get_current_active_user),
-    api_key: Optional[str] = Depends(get_api_key)
+    api_key: str = Depends(require_api_key)
 ):
     """List all uploaded playbooks with pagination"""
-    if not api_key:
-        api_key = settings.openai_api_key
-    
     try:
         if page < 1:
             raise HTTPException(400, "Page must be >= 1")
         if page_size < 1 or page_size > 100:
             raise HTTPException(400, "Page size must be between 1 and 100")
         
-        vector_store = VectorStore(api_key=api_key)
-        result = vector_store.list_playbooks(page=page, page_size=page_size)
+        vector_store = get_vector_store(api_key)
+        result = await asyncio.to_thread(vector_store.list_playbooks, page=page, page_size=page_size)
         return result
     except HTTPException:
         raise
@@ -308,19 +560,16 @@ async def list_playbooks(
         logger.error(f"Error listing playbooks: {e}")
         raise HTTPException(500, f"Error listing playbooks: {str(e)}")
 
-@app.get(f"{settings.api_prefix}/playbooks/{{playbook_id}}")
+@router.get("/playbooks/{playbook_id}")
 async def get_playbook_info(
     playbook_id: str,
-    current_user: User = Depends(get_current_active_user),
-    api_key: Optional[str] = Depends(get_api_key)
+    current_user: CurrentUser,
+    api_key: str = Depends(require_api_key)
 ):
     """Get information about a specific playbook"""
-    if not api_key:
-        api_key = settings.openai_api_key
-    
     try:
-        vector_store = VectorStore(api_key=api_key)
-        info = vector_store.get_playbook_info(playbook_id)
+        vector_store = get_vector_store(api_key)
+        info = await asyncio.to_thread(vector_store.get_playbook_info, playbook_id)
         if not info:
             raise HTTPException(404, "Playbook not found")
         return info
@@ -330,53 +579,56 @@ async def get_playbook_info(
         logger.error(f"Error getting playbook info: {e}")
         raise HTTPException(500, f"Error getting playbook info: {str(e)}")
 
-@app.get(f"{settings.api_prefix}/playbooks/{{playbook_id}}/summary")
+@router.get("/playbooks/{playbook_id}/summary")
 @limiter.limit("5/minute")
 async def get_playbook_summary(
     request: Request,
     playbook_id: str,
-    current_user: User = Depends(get_current_active_user),
-    api_key: Optional[str] = Depends(get_api_key)
+    current_user: CurrentUser,
+    api_key: str = Depends(require_api_key)
 ):
     """Generate a summary of a playbook's key points"""
-    if not api_key:
-        raise HTTPException(400, "OpenAI API key required. Please provide via X-API-Key header.")
-    
     try:
-        vector_store = VectorStore(api_key=api_key)
-        qa_engine = QAEngine(vector_store, api_key=api_key)
-        summary = qa_engine.generate_summary(playbook_id)
+        qa_engine = get_qa_engine(api_key)
+        # Retrieval and the completion call both block; keep them off the event loop
+        summary = await asyncio.to_thread(qa_engine.generate_summary, playbook_id)
         return summary
     except Exception as e:
         logger.error(f"Error generating summary: {e}")
         raise HTTPException(500, f"Error generating summary: {str(e)}")
 
-@app.delete(f"{settings.api_prefix}/playbooks/{{playbook_id}}")
+@router.delete("/playbooks/{playbook_id}")
 async def delete_playbook(
     playbook_id: str,
-    current_user: User = Depends(get_current_active_user),
-    api_key: Optional[str] = Depends(get_api_key)
+    current_user: CurrentUser,
+    api_key: str = Depends(require_api_key)
 ):
     """Delete a playbook and its associated data"""
-    if not api_key:
-        api_key = settings.openai_api_key
-    
     try:
         # Check if playbook exists
-        vector_store = VectorStore(api_key=api_key)
-        info = vector_store.get_playbook_info(playbook_id)
+        vector_store = get_vector_store(api_key)
+        info = await asyncio.to_thread(vector_store.get_playbook_info, playbook_id)
         if not info:
             raise HTTPException(404, "Playbook not found")
         
         # Delete from vector store
-        vector_store.delete_playbook(playbook_id)
+        await asyncio.to_thread(vector_store.delete_playbook, playbook_id)
+        _answer_cache.clear()
         
-        # Delete uploaded file
-        for ext in settings.allowed_extensions:
-            file_path = os.path.join(settings.upload_directory, f"{playbook_id}.{ext}")
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        # Delete uploaded file; its extension was recorded as file_type at upload,
+        # older entries without it fall back to a single directory listing
+        upload_dir = Path(settings.upload_directory)
+        file_type = info.get("file_type")
+        if file_type:
+            file_paths = [upload_dir / f"{playbook_id}.{file_type}"]
+        else:
+            file_paths = list(upload_dir.glob(f"{playbook_id}.*"))
+        for file_path in file_paths:
+            try:
+                file_path.unlink()
                 logger.info(f"Deleted file: {file_path}")
+            except FileNotFoundError:
+                pass
         
         return {"message": "Playbook deleted successfully", "playbook_id": playbook_id}
     except HTTPException:
@@ -385,20 +637,17 @@ async def delete_playbook(
         logger.error(f"Error deleting playbook: {e}")
         raise HTTPException(500, f"Error deleting playbook: {str(e)}")
 
-@app.get(f"{settings.api_prefix}/stats")
+@router.get("/stats")
 async def get_statistics(
-    current_user: User = Depends(get_current_active_user),
-    api_key: Optional[str] = Depends(get_api_key)
+    current_user: CurrentUser,
+    api_key: str = Depends(require_api_key)
 ):
     """Get system statistics and usage metrics"""
-    if not api_key:
-        api_key = settings.openai_api_key
-    
     try:
-        vector_store = VectorStore(api_key=api_key)
-        qa_engine = QAEngine(vector_store, api_key=api_key)
+        vector_store = get_vector_store(api_key)
+        qa_engine = get_qa_engine(api_key)
         
-        vector_stats = vector_store.get_statistics()
+        vector_stats = await asyncio.to_thread(vector_store.get_statistics)
         token_usage = qa_engine.get_token_usage_report()
         
         return {
@@ -410,11 +659,13 @@ async def get_statistics(
         logger.error(f"Error getting statistics: {e}")
         raise HTTPException(500, f"Error getting statistics: {str(e)}")
 
+app.include_router(router)
+
 # Error handlers
 @app.exception_handler(ValueError)
 async def value_error_handler(request: Request, exc: ValueError):
     logger.error(f"ValueError: {exc}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=400,
         content={"detail": str(exc)}
     )
@@ -422,33 +673,20 @@ async def value_error_handler(request: Request, exc: ValueError):
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     logger.error(f"Unhandled exception: {exc}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
-        content={"detail": "An internal error occurred. Please try again later."}
+        content=INTERNAL_ERROR_CONTENT
     )
 
-# Startup and shutdown events
-@app.on_event("startup")
-async def startup_event():
-    logger.info(f"Starting {settings.api_title} v{settings.api_version}")
-    logger.info(f"Upload directory: {settings.upload_directory}")
-    logger.info(f"ChromaDB directory: {settings.chroma_persist_directory}")
-    
-    # Create necessary directories
-    Path(settings.upload_directory).mkdir(parents=True, exist_ok=True)
-    Path(settings.chroma_persist_directory).mkdir(parents=True, exist_ok=True)
-    Path("logs").mkdir(exist_ok=True)
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("Shutting down application")
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=settings.debug,
+        workers=None if settings.debug else settings.web_concurrency,
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools",
         log_config=None  # Use our custom logging
     )
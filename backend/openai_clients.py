@@ -0,0 +1,13 @@
+import httpx
+import openai
+
+# One connection pool for every OpenAI client in the process. Clients are created per API
+# key, and each would otherwise open its own pool and pay a fresh TLS handshake.
+_http_client = httpx.Client(
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=30.0),
+    timeout=httpx.Timeout(60.0, connect=5.0)
+)
+
+def create_openai_client(api_key: str, **kwargs) -> openai.OpenAI:
+    """OpenAI client for `api_key` that reuses the shared keep-alive connection pool"""
+    return openai.OpenAI(api_key=api_key, http_client=_http_client, **kwargs)
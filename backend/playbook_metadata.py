@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class PlaybookMetadataStore:
+    """One row of metadata per playbook in a plain SQLite table.
+
+    Listing and lookups are indexed queries with LIMIT/OFFSET pagination, and no
+    placeholder vectors are kept in Chroma just to make the rows storable there.
+
+    The file also holds the index generation, a counter bumped whenever indexed content
+    changes. Every worker process opens the same file, so per-process caches keyed on it
+    notice uploads and deletes made by any worker. Likewise, one-off maintenance tasks are
+    claimed here so that only one worker runs them.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS playbook_metadata ("
+            "playbook_id TEXT PRIMARY KEY, metadata_json TEXT NOT NULL, "
+            "chunk_count INTEGER NOT NULL DEFAULT 0, created_at TEXT NOT NULL DEFAULT '')"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS index_generation ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), generation INTEGER NOT NULL)"
+        )
+        self._connection.execute("INSERT OR IGNORE INTO index_generation (id, generation) VALUES (0, 0)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS task_claims (name TEXT PRIMARY KEY, claimed_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def upsert(self, playbook_id: str, metadata: Dict):
+        # ON CONFLICT keeps the row in place, so listing order stays upload order
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO playbook_metadata (playbook_id, metadata_json, chunk_count, created_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (playbook_id) DO UPDATE SET "
+                "metadata_json = excluded.metadata_json, chunk_count = excluded.chunk_count, "
+                "created_at = excluded.created_at",
+                (playbook_id, json.dumps(metadata), metadata.get("chunk_count", 0),
+                 metadata.get("created_at", ""))
+            )
+
+    def get(self, playbook_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT metadata_json FROM playbook_metadata WHERE playbook_id = ?", (playbook_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def page(self, offset: int, limit: int) -> Tuple[int, List[Tuple[str, Dict]]]:
+        """Total playbook count and one page of (playbook_id, metadata) in upload order"""
+        with self._lock:
+            total = self._connection.execute("SELECT COUNT(*) FROM playbook_metadata").fetchone()[0]
+            rows = self._connection.execute(
+                "SELECT playbook_id, metadata_json FROM playbook_metadata ORDER BY rowid LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return total, [(playbook_id, json.loads(metadata_json)) for playbook_id, metadata_json in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM playbook_metadata").fetchone()[0]
+
+    def delete(self, playbook_id: str):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM playbook_metadata WHERE playbook_id = ?", (playbook_id,))
+
+    def generation(self) -> int:
+        """Current index generation, as last committed by any process"""
+        with self._lock:
+            return self._connection.execute("SELECT generation FROM index_generation").fetchone()[0]
+
+    def bump_generation(self):
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE index_generation SET generation = generation + 1")
+
+    def claim_task(self, name: str, lease_seconds: float) -> bool:
+        """Claim a task for this process unless another holds an unexpired claim on it
+
+        The lease lets a task abandoned by a crashed worker be picked up again.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO task_claims (name, claimed_at) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET claimed_at = excluded.claimed_at "
+                "WHERE task_claims.claimed_at < ?",
+                (name, now, now - lease_seconds)
+            )
+            return cursor.rowcount == 1
+
+    def renew_task(self, name: str):
+        """Extend this process's claim on a long-running task"""
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE task_claims SET claimed_at = ? WHERE name = ?", (time.time(), name))
+
+    def release_task(self, name: str):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM task_claims WHERE name = ?", (name,))
+
+_metadata_store: Optional[PlaybookMetadataStore] = None
+_metadata_store_lock = threading.Lock()
+
+def get_playbook_metadata_store() -> PlaybookMetadataStore:
+    """Process-wide store kept next to the Chroma data it describes"""
+    global _metadata_store
+    with _metadata_store_lock:
+        if _metadata_store is None:
+            _metadata_store = PlaybookMetadataStore(
+                os.path.join(settings.chroma_persist_directory, "playbooks.db")
+            )
+        return _metadata_store
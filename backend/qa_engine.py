@@ -1,16 +1,80 @@
-import openai
-from typing import List, Dict, Optional, Tuple
+from openai.types import CompletionUsage
+from typing import Iterator, List, Dict, Optional, Tuple
 import os
 import logging
 from vector_store import VectorStore
 from config import settings
+from openai_clients import create_openai_client
 from tenacity import retry, stop_after_attempt, wait_exponential
+import hashlib
 import json
+import re
+from collections import defaultdict
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# USD per 1K (prompt, completion) tokens; unknown models are costed at GPT-4 Turbo rates
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4-turbo-preview": (0.01, 0.03),
+    "gpt-4-turbo": (0.01, 0.03),
+}
+DEFAULT_PRICING = MODEL_PRICING["gpt-4-turbo-preview"]
+
+# Leading bullet or "1." / "1)" numbering on a follow-up question line
+_LIST_MARKER_RE = re.compile(r'^\s*(?:[-•*]|\d+[.)])\s*')
+
+# Phrases with which a model admits the passages did not answer the question
+UNCERTAIN_ANSWER_MARKERS = (
+    "don't have enough information",
+    "do not have enough information",
+    "not sure",
+    "isn't in the passages",
+    "is not in the passages",
+    "not mentioned in the passages",
+    "passages do not",
+    "passages don't",
+)
+
+# Passage score cutoffs for text-embedding-3-small, whose cosine similarities for relevant
+# passages sit well below ada-002's (roughly 0.4-0.7 rather than 0.7-0.9)
+RETRIEVAL_MIN_SCORE = 0.4  # Kept below settings.min_passage_score_for_llm
+HIGH_QUALITY_PASSAGE_SCORE = 0.6
+WEAK_MATCH_AVERAGE_SCORE = 0.5
+
 class QAEngine:
+    # Static prompt text, built once; the system message always leads so the prefix stays identical
+    SYSTEM_PROMPT = """You are a brand guidelines expert assistant. Your role is to answer questions about brand playbooks accurately and precisely.
+
+When answering:
+1. Base your answers strictly on the provided passages from the brand playbook
+2. If the information isn't in the passages, say so clearly
+3. Quote relevant parts verbatim when appropriate, using quotation marks
+4. Be specific and actionable in your responses
+5. Maintain the brand's tone and terminology as found in the playbook
+6. If relevant, suggest follow-up questions that might help clarify the brand guidelines
+7. Structure your answer with clear sections if it's complex
+
+Remember: You are helping users understand and apply brand guidelines correctly."""
+
+    USER_PROMPT_TEMPLATE = """Based on the following passages from the brand playbook, please answer this question:
+
+Question: {question}
+
+Relevant passages from the brand playbook:
+{context}
+
+Please provide a clear, accurate answer based on these passages. If you quote from the passages, use quotation marks.
+
+At the end, suggest 2-3 relevant follow-up questions that might help the user better understand the brand guidelines."""
+
+    # Appended for non-streamed answers, which are requested in JSON mode
+    JSON_ANSWER_INSTRUCTION = """
+
+Respond as a JSON object with the keys "answer" (string) and "follow_up_questions" (array of 2-3 strings)."""
+
     def __init__(self, vector_store: VectorStore, api_key: Optional[str] = None):
         self.vector_store = vector_store
         
@@ -19,8 +83,11 @@ class QAEngine:
         if not self.api_key:
             raise ValueError("OpenAI API key is required")
         
-        openai.api_key = self.api_key
+        self.client = create_openai_client(self.api_key)
+        # Answers start on the fast model and escalate to the main one when it looks unsure
         self.model = settings.openai_model
+        self.fast_model = settings.openai_fast_model
+        self.min_passage_score = settings.min_passage_score_for_llm
         self.temperature = 0.5  # Balanced between creativity and accuracy
         
         # Token tracking
@@ -37,27 +104,28 @@ class QAEngine:
         logger.info(f"Answering question: '{question}' for playbook: {playbook_id or 'all'}")
         
         # Search for relevant passages
-        relevant_passages = self.vector_store.search(
-            query=question,
-            playbook_id=playbook_id,
-            top_k=7,  # Get more passages for better context
-            score_threshold=0.6  # Lower threshold to get more context
-        )
+        relevant_passages = self._search_passages(question, playbook_id)
         
         if not relevant_passages:
             logger.warning("No relevant passages found")
-            return {
-                "answer": "I couldn't find any relevant information in the brand playbook to answer your question. Please try rephrasing your question or ensure the relevant playbook has been uploaded.",
-                "passages": [],
-                "confidence": 0.0,
-                "tokens_used": 0
-            }
+            return self._no_passages_response()
+        if relevant_passages[0]['score'] < self.min_passage_score:
+            logger.info(f"Best passage score {relevant_passages[0]['score']:.2f} too low, skipping the model")
+            return self._low_relevance_response(relevant_passages)
         
         # Prepare context from passages
         context = self._prepare_enhanced_context(relevant_passages)
         
-        # Generate answer using GPT-4
-        answer_data = self._generate_answer(question, context, conversation_history)
+        # Generate answer, cheap model first
+        if self.fast_model and self.fast_model != self.model:
+            answer_data = self._generate_answer(question, context, conversation_history, model=self.fast_model)
+            if self._needs_escalation(answer_data, relevant_passages):
+                logger.info(f"Escalating answer from {self.fast_model} to {self.model}")
+                fast_tokens = answer_data["tokens_used"]
+                answer_data = self._generate_answer(question, context, conversation_history)
+                answer_data["tokens_used"] += fast_tokens
+        else:
+            answer_data = self._generate_answer(question, context, conversation_history)
         
         # Calculate confidence based on passage scores and answer quality
         confidence = self._calculate_confidence(relevant_passages, answer_data)
@@ -77,73 +145,161 @@ class QAEngine:
         logger.info(f"Answer generated with confidence: {confidence:.2f}")
         return response
     
+    def stream_answer(self, question: str, playbook_id: Optional[str] = None,
+                      conversation_history: Optional[List[Dict]] = None) -> Iterator[Dict]:
+        """Answer a question, yielding the answer text as the model generates it.
+
+        Yields a "passages" event, then "token" events, then a final "done" event carrying
+        the same fields answer_question returns.
+        """
+        logger.info(f"Streaming answer to: '{question}' for playbook: {playbook_id or 'all'}")
+        
+        relevant_passages = self._search_passages(question, playbook_id)
+        if not relevant_passages:
+            logger.warning("No relevant passages found")
+            yield {"type": "done", **self._no_passages_response()}
+            return
+        if relevant_passages[0]['score'] < self.min_passage_score:
+            logger.info(f"Best passage score {relevant_passages[0]['score']:.2f} too low, skipping the model")
+            yield {"type": "done", **self._low_relevance_response(relevant_passages)}
+            return
+        
+        passages = self._format_passages(relevant_passages[:3])
+        yield {"type": "passages", "passages": passages}
+        
+        context = self._prepare_enhanced_context(relevant_passages)
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._build_messages(question, context, conversation_history),
+            temperature=self.temperature,
+            max_tokens=800,
+            presence_penalty=0.1,
+            frequency_penalty=0.1,
+            stream=True,
+            # The final chunk then carries token usage (not a named argument in this SDK version)
+            extra_body={"stream_options": {"include_usage": True}}
+        )
+        
+        parts = []
+        usage = None
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield {"type": "token", "content": chunk.choices[0].delta.content}
+            usage = getattr(chunk, "usage", None) or usage
+        
+        answer, follow_up_questions = self._split_follow_ups("".join(parts))
+        tokens_used = 0
+        if usage:
+            usage = CompletionUsage(**usage) if isinstance(usage, dict) else usage
+            tokens_used = usage.total_tokens
+            self._track_token_usage(usage, self.model)
+        
+        answer_data = {"answer": answer, "follow_up_questions": follow_up_questions, "tokens_used": tokens_used}
+        confidence = self._calculate_confidence(relevant_passages, answer_data)
+        self.token_usage["query_count"] += 1
+        
+        yield {
+            "type": "done",
+            "answer": answer,
+            "passages": passages,
+            "confidence": confidence,
+            "tokens_used": tokens_used,
+            "follow_up_questions": follow_up_questions
+        }
+    
+    def _search_passages(self, question: str, playbook_id: Optional[str]) -> List[Dict]:
+        passages = self.vector_store.search(
+            query=question,
+            playbook_id=playbook_id,
+            top_k=7,  # Get more passages for better context
+            # Weak matches still reach the min_passage_score_for_llm gate
+            score_threshold=RETRIEVAL_MIN_SCORE
+        )
+        return self._dedupe_passages(passages)
+    
+    @staticmethod
+    def _dedupe_passages(passages: List[Dict], jaccard_threshold: float = 0.85) -> List[Dict]:
+        """Drop passages that repeat a higher-scored one, so the prompt carries each text once.
+
+        Exact duplicates (after lowercasing and collapsing whitespace) are caught by hash;
+        near duplicates by Jaccard similarity of their 5-word shingles.
+        """
+        kept = []
+        seen_hashes = set()
+        kept_shingles = []
+        for passage in sorted(passages, key=lambda p: p['score'], reverse=True):
+            words = passage['content'].lower().split()
+            digest = hashlib.blake2b(" ".join(words).encode(), digest_size=16).digest()
+            if digest in seen_hashes:
+                continue
+            
+            shingles = frozenset(hash(tuple(words[i:i + 5])) for i in range(max(len(words) - 4, 1)))
+            if any(len(shingles & other) / len(shingles | other) >= jaccard_threshold
+                   for other in kept_shingles):
+                continue
+            
+            seen_hashes.add(digest)
+            kept_shingles.append(shingles)
+            kept.append(passage)
+        
+        if len(kept) < len(passages):
+            logger.debug(f"Dropped {len(passages) - len(kept)} duplicate passages")
+        return kept
+    
+    @staticmethod
+    def _no_passages_response() -> Dict:
+        return {
+            "answer": "I couldn't find any relevant information in the brand playbook to answer your question. Please try rephrasing your question or ensure the relevant playbook has been uploaded.",
+            "passages": [],
+            "confidence": 0.0,
+            "tokens_used": 0
+        }
+    
+    def _low_relevance_response(self, passages: List[Dict]) -> Dict:
+        """Answer for passages too weak to ground a model answer; the closest ones are still shown"""
+        return {
+            "answer": "I couldn't find sufficiently relevant information in the brand playbook to answer your question. The closest passages are listed below; try rephrasing your question to be more specific.",
+            "passages": self._format_passages(passages[:3]),
+            "confidence": 0.0,
+            "tokens_used": 0
+        }
+    
     def _prepare_enhanced_context(self, passages: List[Dict]) -> str:
         """Prepare enhanced context from retrieved passages"""
-        context_parts = []
-        
         # Group passages by page/section for better organization
-        passages_by_page = {}
+        passages_by_page = defaultdict(list)
         for passage in passages:
-            page = passage['metadata'].get('page_number', 'N/A')
-            if page not in passages_by_page:
-                passages_by_page[page] = []
-            passages_by_page[page].append(passage)
-        
-        # Format context with better structure
-        for page, page_passages in sorted(passages_by_page.items()):
-            context_parts.append(f"\n--- Page {page} ---")
-            for i, passage in enumerate(page_passages):
-                chunk_type = passage['metadata'].get('chunk_type', 'text')
-                score = passage['score']
-                
-                context_parts.append(f"\n[{chunk_type.upper()} - Relevance: {score:.2f}]")
-                context_parts.append(passage['content'])
-        
-        return "\n".join(context_parts)
+            passages_by_page[passage['metadata'].get('page_number', 'N/A')].append(passage)
+        
+        pages = passages_by_page.items()
+        if len(passages_by_page) > 1:
+            # Pages without a number ('N/A') sort after numbered ones instead of raising TypeError
+            pages = sorted(pages, key=lambda item: (0, item[0]) if isinstance(item[0], int) else (1, 0))
+        
+        # Format context with better structure, one formatted string per page
+        return "\n".join(
+            f"\n--- Page {page} ---" + "".join(
+                f"\n\n[{passage['metadata'].get('chunk_type', 'text').upper()} - Relevance: {passage['score']:.2f}]\n{passage['content']}"
+                for passage in page_passages
+            )
+            for page, page_passages in pages
+        )
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def _generate_answer(self, question: str, context: str, 
-                        conversation_history: Optional[List[Dict]] = None) -> Dict:
-        """Generate an answer using GPT-4 with retry logic"""
+                        conversation_history: Optional[List[Dict]] = None,
+                        model: Optional[str] = None) -> Dict:
+        """Generate an answer with retry logic, on the main model unless another is given"""
+        model = model or self.model
         
-        system_prompt = """You are a brand guidelines expert assistant. Your role is to answer questions about brand playbooks accurately and precisely.
-
-When answering:
-1. Base your answers strictly on the provided passages from the brand playbook
-2. If the information isn't in the passages, say so clearly
-3. Quote relevant parts verbatim when appropriate, using quotation marks
-4. Be specific and actionable in your responses
-5. Maintain the brand's tone and terminology as found in the playbook
-6. If relevant, suggest follow-up questions that might help clarify the brand guidelines
-7. Structure your answer with clear sections if it's complex
-
-Remember: You are helping users understand and apply brand guidelines correctly."""
-
-        user_prompt = f"""Based on the following passages from the brand playbook, please answer this question:
-
-Question: {question}
-
-Relevant passages from the brand playbook:
-{context}
-
-Please provide a clear, accurate answer based on these passages. If you quote from the passages, use quotation marks.
-
-At the end, suggest 2-3 relevant follow-up questions that might help the user better understand the brand guidelines."""
-
         try:
-            # Build message history
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            # Add conversation history if provided
-            if conversation_history:
-                messages.extend(conversation_history[-4:])  # Last 4 messages for context
-            
-            messages.append({"role": "user", "content": user_prompt})
+            messages = self._build_messages(question, context, conversation_history, json_output=True)
             
             # Make API call
-            client = openai.OpenAI(api_key=self.api_key)
-            response = client.chat.completions.create(
-                model=self.model,
+            response = self.client.chat.completions.create(
+                model=model,
+                response_format={"type": "json_object"},
                 messages=messages,
                 temperature=self.temperature,
                 max_tokens=800,
@@ -152,25 +308,11 @@ At the end, suggest 2-3 relevant follow-up questions that might help the user be
             )
             
             # Extract answer and follow-up questions
-            full_response = response.choices[0].message.content
-            
-            # Try to parse follow-up questions
-            follow_up_questions = []
-            if "follow-up questions:" in full_response.lower():
-                parts = full_response.split("follow-up questions:", 1)
-                answer = parts[0].strip()
-                questions_text = parts[1].strip()
-                
-                # Extract questions
-                import re
-                questions = re.findall(r'[-•*]?\s*(.+?)(?=[-•*]|$)', questions_text)
-                follow_up_questions = [q.strip() for q in questions if q.strip()][:3]
-            else:
-                answer = full_response
+            answer, follow_up_questions = self._parse_json_answer(response.choices[0].message.content)
             
             # Track token usage
             tokens_used = response.usage.total_tokens
-            self._track_token_usage(response.usage)
+            self._track_token_usage(response.usage, model)
             
             return {
                 "answer": answer,
@@ -182,16 +324,75 @@ At the end, suggest 2-3 relevant follow-up questions that might help the user be
             logger.error(f"Error generating answer: {e}")
             raise
     
+    def _build_messages(self, question: str, context: str,
+                        conversation_history: Optional[List[Dict]] = None,
+                        json_output: bool = False) -> List[Dict]:
+        """Build the chat messages: system prompt, recent history, then the question with context"""
+        messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
+        
+        # Add conversation history if provided
+        if conversation_history:
+            messages.extend(conversation_history[-4:])  # Last 4 messages for context
+        
+        user_prompt = self.USER_PROMPT_TEMPLATE.format(question=question, context=context)
+        if json_output:
+            user_prompt += self.JSON_ANSWER_INSTRUCTION
+        messages.append({"role": "user", "content": user_prompt})
+        return messages
+    
+    @staticmethod
+    def _split_follow_ups(full_response: str) -> Tuple[str, List[str]]:
+        """Separate the answer from the suggested follow-up questions at its end"""
+        marker = "follow-up questions:"
+        marker_index = full_response.lower().find(marker)
+        if marker_index == -1:
+            return full_response, []
+        
+        answer = full_response[:marker_index].strip()
+        questions_text = full_response[marker_index + len(marker):].strip()
+        
+        # One question per line, without list bullets or numbering
+        questions = (_LIST_MARKER_RE.sub("", line).strip() for line in questions_text.splitlines())
+        return answer, [q for q in questions if q][:3]
+    
+    @classmethod
+    def _parse_json_answer(cls, content: str) -> Tuple[str, List[str]]:
+        """Read a JSON-mode completion, falling back to the prose format if it is malformed"""
+        try:
+            parsed = json.loads(content)
+            answer = parsed["answer"]
+            follow_up_questions = parsed.get("follow_up_questions") or []
+            if isinstance(answer, str) and isinstance(follow_up_questions, list):
+                questions = (str(q).strip() for q in follow_up_questions)
+                return answer.strip(), [q for q in questions if q][:3]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            pass
+        logger.warning("Answer was not valid JSON; parsing it as text")
+        return cls._split_follow_ups(content)
+    
+    @staticmethod
+    def _needs_escalation(answer_data: Dict, passages: List[Dict]) -> bool:
+        """Whether a fast-model answer should be regenerated on the main model"""
+        answer = answer_data["answer"].lower()
+        if any(marker in answer for marker in UNCERTAIN_ANSWER_MARKERS):
+            return True
+        
+        # Very short answers from weakly matching passages are likely incomplete
+        avg_score = sum(p['score'] for p in passages) / len(passages)
+        return len(answer.split()) < 20 and avg_score < WEAK_MATCH_AVERAGE_SCORE
+    
     def _calculate_confidence(self, passages: List[Dict], answer_data: Dict) -> float:
         """Calculate confidence score based on multiple factors"""
         if not passages:
             return 0.0
         
+        scores = [p['score'] for p in passages]
+        
         # Factor 1: Average passage relevance score
-        avg_score = sum(p['score'] for p in passages) / len(passages)
+        avg_score = sum(scores) / len(scores)
         
-        # Factor 2: Number of high-quality passages (score > 0.8)
-        high_quality_passages = sum(1 for p in passages if p['score'] > 0.8)
+        # Factor 2: Number of high-quality passages
+        high_quality_passages = sum(score > HIGH_QUALITY_PASSAGE_SCORE for score in scores)
         quality_factor = min(high_quality_passages / 3, 1.0)  # Normalize to 1.0
         
         # Factor 3: Answer length (longer answers often indicate more context)
@@ -217,17 +418,18 @@ At the end, suggest 2-3 relevant follow-up questions that might help the user be
         
         return formatted
     
-    def _track_token_usage(self, usage):
+    def _track_token_usage(self, usage, model: str):
         """Track token usage for cost monitoring"""
         self.token_usage["total_prompt_tokens"] += usage.prompt_tokens
         self.token_usage["total_completion_tokens"] += usage.completion_tokens
         
-        # Calculate cost (GPT-4 Turbo pricing as of 2024)
-        prompt_cost = usage.prompt_tokens * 0.01 / 1000
-        completion_cost = usage.completion_tokens * 0.03 / 1000
+        # Calculate cost from the pricing of the model that served the request
+        prompt_price, completion_price = MODEL_PRICING.get(model, DEFAULT_PRICING)
+        prompt_cost = usage.prompt_tokens * prompt_price / 1000
+        completion_cost = usage.completion_tokens * completion_price / 1000
         self.token_usage["total_cost"] += (prompt_cost + completion_cost)
         
-        logger.info(f"Token usage - Prompt: {usage.prompt_tokens}, "
+        logger.info(f"Token usage ({model}) - Prompt: {usage.prompt_tokens}, "
                    f"Completion: {usage.completion_tokens}, "
                    f"Cost: ${prompt_cost + completion_cost:.4f}")
     
@@ -247,7 +449,9 @@ At the end, suggest 2-3 relevant follow-up questions that might help the user be
         sample_passages = self.vector_store.search(
             query="brand guidelines overview mission values visual identity",
             playbook_id=playbook_id,
-            top_k=10
+            top_k=10,
+            # Any of the playbook's passages will do; this generic query scores low against all of them
+            score_threshold=0.0
         )
         
         if not sample_passages:
@@ -270,8 +474,7 @@ Excerpts:
 Provide a structured summary with clear sections."""
         
         try:
-            client = openai.OpenAI(api_key=self.api_key)
-            response = client.chat.completions.create(
+            response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a brand expert summarizing key brand guidelines."},
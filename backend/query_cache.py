@@ -0,0 +1,155 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class SemanticQueryCache:
+    """Process-wide cache in front of VectorStore.search.
+
+    Query text (case- and whitespace-insensitive) maps to its embedding, skipping the
+    OpenAI call. Search results are
+    kept per scope (playbook, top_k, threshold) and reused for any later query whose
+    embedding is within `similarity_threshold` cosine similarity, skipping the ANN query.
+
+    Other worker processes change the index without touching this cache, so callers pass
+    the shared index generation to `sync` before each lookup.
+    """
+
+    def __init__(self, max_embeddings: int = 1024, max_results: int = 256,
+                 similarity_threshold: float = 0.97):
+        self.max_embeddings = max_embeddings
+        self.max_results = max_results
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.Lock()
+        self._embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._results: "OrderedDict[int, Tuple[Hashable, np.ndarray, List[Dict]]]" = OrderedDict()
+        self._next_result_id = 0
+        self._generation = 0
+        self._store_generation: Optional[int] = None
+        self._hits = 0
+        self._misses = 0
+        self._embedding_hits = 0
+        self._embedding_misses = 0
+
+        # Stacked unit vectors of cached results, rebuilt lazily after inserts/evictions
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+
+    @property
+    def generation(self) -> int:
+        """Bumped on every invalidation; results computed under an older generation are dropped"""
+        return self._generation
+
+    def get_embedding(self, text: str) -> Optional[List[float]]:
+        key = self._normalize(text)
+        with self._lock:
+            embedding = self._embeddings.get(key)
+            if embedding is None:
+                self._embedding_misses += 1
+            else:
+                self._embeddings.move_to_end(key)
+                self._embedding_hits += 1
+            return embedding
+
+    def put_embedding(self, text: str, embedding: List[float]):
+        key = self._normalize(text)
+        with self._lock:
+            self._embeddings[key] = embedding
+            self._embeddings.move_to_end(key)
+            if len(self._embeddings) > self.max_embeddings:
+                self._embeddings.popitem(last=False)
+
+    def get_results(self, embedding: List[float], scope: Hashable) -> Optional[List[Dict]]:
+        """Return cached passages for the nearest cached query in the same scope, if close enough"""
+        query = self._unit(embedding)
+        with self._lock:
+            if not self._results:
+                self._misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_ids = list(self._results)
+                self._matrix = np.stack([self._results[i][1] for i in self._matrix_ids])
+
+            similarities = self._matrix @ query
+            for index in np.argsort(similarities)[::-1]:
+                if similarities[index] < self.similarity_threshold:
+                    break
+                result_id = self._matrix_ids[index]
+                entry_scope, _, passages = self._results[result_id]
+                if entry_scope == scope:
+                    self._results.move_to_end(result_id)
+                    self._hits += 1
+                    logger.debug(f"Query cache hit (similarity {similarities[index]:.3f})")
+                    return list(passages)
+            self._misses += 1
+            return None
+
+    def put_results(self, embedding: List[float], scope: Hashable, passages: List[Dict],
+                    generation: int):
+        """Cache passages unless the store changed since `generation` was read"""
+        vector = self._unit(embedding)
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._results[self._next_result_id] = (scope, vector, list(passages))
+            self._next_result_id += 1
+            if len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        """Drop cached search results after the indexed content changes"""
+        with self._lock:
+            self._clear_results()
+
+    def sync(self, store_generation: int):
+        """Drop cached search results if the shared index generation moved since the last call"""
+        with self._lock:
+            if store_generation != self._store_generation:
+                self._store_generation = store_generation
+                self._clear_results()
+
+    def _clear_results(self):
+        self._generation += 1
+        self._results.clear()
+        self._matrix = None
+        self._matrix_ids = []
+
+    def stats(self) -> Dict[str, float]:
+        """Embedding and search result hit/miss counts since the process started"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            embedding_lookups = self._embedding_hits + self._embedding_misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "cached_results": len(self._results),
+                "embedding_hits": self._embedding_hits,
+                "embedding_misses": self._embedding_misses,
+                "embedding_hit_rate": round(self._embedding_hits / embedding_lookups, 4) if embedding_lookups else 0.0,
+                "cached_embeddings": len(self._embeddings)
+            }
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(text.split()).casefold()
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+# Shared by every VectorStore in the process; they all read the same Chroma collection
+query_cache = SemanticQueryCache(
+    max_results=settings.query_cache_size,
+    similarity_threshold=settings.query_cache_similarity
+)
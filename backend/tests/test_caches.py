@@ -0,0 +1,222 @@
+import pytest
+import threading
+import time
+import numpy as np
+from embedding_cache import EmbeddingCache
+from query_cache import SemanticQueryCache
+from playbook_metadata import PlaybookMetadataStore
+from vector_store import EmbeddingMicroBatcher
+
+class TestEmbeddingCache:
+    """Test the on-disk embedding cache"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return EmbeddingCache(str(tmp_path / "embeddings.db"))
+
+    def test_miss_then_hit(self, cache):
+        """Stored vectors come back as float32 arrays; unknown keys are absent"""
+        key = EmbeddingCache.key("model", 4, "hello")
+        assert cache.get_many([key]) == {}
+
+        cache.set_many({key: np.array([0.5, 1.0, 1.5, 2.0])})
+        found = cache.get_many([key, EmbeddingCache.key("model", 4, "other")])
+
+        assert list(found) == [key]
+        assert found[key].dtype == np.float32
+        assert found[key].tolist() == [0.5, 1.0, 1.5, 2.0]
+
+    def test_key_depends_on_model_and_dimensions(self):
+        """The same text embedded by another model or size is a different entry"""
+        keys = {
+            EmbeddingCache.key("model", 4, "hello"),
+            EmbeddingCache.key("model", 8, "hello"),
+            EmbeddingCache.key("other", 4, "hello"),
+        }
+        assert len(keys) == 3
+
+    def test_many_keys(self, cache):
+        """Lookups larger than one SQLite parameter batch return every entry"""
+        items = {EmbeddingCache.key("model", 2, str(i)): np.array([i, i], dtype=np.float32) for i in range(2000)}
+        cache.set_many(items)
+
+        found = cache.get_many(list(items))
+
+        assert len(found) == 2000
+        assert all(found[key].tolist() == vector.tolist() for key, vector in items.items())
+
+    def test_persists_across_instances(self, tmp_path):
+        """A new cache on the same file sees earlier writes"""
+        path = str(tmp_path / "embeddings.db")
+        key = EmbeddingCache.key("model", 2, "hello")
+        EmbeddingCache(path).set_many({key: np.array([1.0, 2.0])})
+
+        assert EmbeddingCache(path).get_many([key])[key].tolist() == [1.0, 2.0]
+
+class TestSemanticQueryCache:
+    """Test the semantic search result cache"""
+
+    @pytest.fixture
+    def cache(self):
+        return SemanticQueryCache(max_embeddings=2, max_results=2, similarity_threshold=0.95)
+
+    def test_embedding_normalization(self, cache):
+        """Query embeddings are shared across case and whitespace variants"""
+        assert cache.get_embedding("What colours?") is None
+        cache.put_embedding("What colours?", [1.0, 0.0])
+
+        assert cache.get_embedding("  what   COLOURS? ") == [1.0, 0.0]
+        stats = cache.stats()
+        assert stats["embedding_hits"] == 1
+        assert stats["embedding_misses"] == 1
+
+    def test_embedding_eviction(self, cache):
+        """The least recently used embedding is evicted first"""
+        cache.put_embedding("a", [1.0])
+        cache.put_embedding("b", [2.0])
+        cache.get_embedding("a")
+        cache.put_embedding("c", [3.0])
+
+        assert cache.get_embedding("a") == [1.0]
+        assert cache.get_embedding("b") is None
+
+    def test_similar_query_hit(self, cache):
+        """A nearby query in the same scope reuses the cached passages"""
+        passages = [{"content": "Use blue"}]
+        cache.put_results([1.0, 0.0], "scope", passages, cache.generation)
+
+        assert cache.get_results([0.99, 0.05], "scope") == passages
+        assert cache.stats()["hits"] == 1
+
+    def test_misses(self, cache):
+        """Distant queries and other scopes are not served from the cache"""
+        cache.put_results([1.0, 0.0], "scope", [{"content": "Use blue"}], cache.generation)
+
+        assert cache.get_results([0.0, 1.0], "scope") is None
+        assert cache.get_results([1.0, 0.0], "other") is None
+        assert cache.stats()["misses"] == 2
+
+    def test_invalidate(self, cache):
+        """Invalidation drops results and bumps the generation"""
+        generation = cache.generation
+        cache.put_results([1.0, 0.0], "scope", [{"content": "Use blue"}], generation)
+
+        cache.invalidate()
+
+        assert cache.generation == generation + 1
+        assert cache.get_results([1.0, 0.0], "scope") is None
+
+    def test_stale_generation_not_cached(self, cache):
+        """Results computed before an invalidation are discarded"""
+        generation = cache.generation
+        cache.invalidate()
+        cache.put_results([1.0, 0.0], "scope", [{"content": "Use blue"}], generation)
+
+        assert cache.get_results([1.0, 0.0], "scope") is None
+
+    def test_sync(self, cache):
+        """Results survive while the shared generation is unchanged and are dropped when it moves"""
+        cache.sync(0)
+        cache.put_results([1.0, 0.0], "scope", [{"content": "Use blue"}], cache.generation)
+
+        cache.sync(0)
+        assert cache.get_results([1.0, 0.0], "scope") is not None
+
+        cache.sync(1)
+        assert cache.get_results([1.0, 0.0], "scope") is None
+
+class TestEmbeddingMicroBatcher:
+    """Test coalescing of concurrent query embeddings"""
+
+    def test_single_request(self):
+        """A lone caller gets its own embedding"""
+        batcher = EmbeddingMicroBatcher(lambda texts: [[float(len(text))] for text in texts], max_wait=0.001)
+
+        assert batcher.embed("hello") == [5.0]
+
+    def test_full_batch_flushes_together(self):
+        """Concurrent callers share one request and each gets its own vector"""
+        calls = []
+
+        def embed(texts):
+            calls.append(list(texts))
+            return [[float(len(text))] for text in texts]
+
+        batcher = EmbeddingMicroBatcher(embed, max_batch=4, max_wait=5.0)
+        results = {}
+        threads = [
+            threading.Thread(target=lambda text=text: results.__setitem__(text, batcher.embed(text)))
+            for text in ("a", "bb", "ccc", "dddd")
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # The batch filled up, so nobody waited for the window to expire
+        assert time.monotonic() - started < 5.0
+        assert len(calls) == 1
+        assert sorted(calls[0]) == ["a", "bb", "ccc", "dddd"]
+        assert results == {"a": [1.0], "bb": [2.0], "ccc": [3.0], "dddd": [4.0]}
+
+    def test_error_propagates(self):
+        """A failed request raises in every caller it was made for"""
+        def embed(texts):
+            raise RuntimeError("rate limited")
+
+        batcher = EmbeddingMicroBatcher(embed, max_wait=0.001)
+
+        with pytest.raises(RuntimeError, match="rate limited"):
+            batcher.embed("hello")
+        # The batcher is usable again afterwards
+        batcher._embed = lambda texts: [[1.0] for _ in texts]
+        assert batcher.embed("hello") == [1.0]
+
+class TestPlaybookMetadataStore:
+    """Test the SQLite playbook metadata store"""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        return PlaybookMetadataStore(str(tmp_path / "playbooks.db"))
+
+    def test_upsert_and_get(self, store):
+        """Upserting an existing playbook replaces its metadata"""
+        store.upsert("a", {"filename": "a.pdf", "chunk_count": 3})
+        store.upsert("a", {"filename": "a.pdf", "chunk_count": 5})
+
+        assert store.get("a") == {"filename": "a.pdf", "chunk_count": 5}
+        assert store.get("missing") is None
+        assert store.count() == 1
+
+    def test_page_keeps_upload_order(self, store):
+        """Pages list playbooks in upload order, even after one is re-uploaded"""
+        for playbook_id in ("a", "b", "c"):
+            store.upsert(playbook_id, {"filename": f"{playbook_id}.pdf"})
+        store.upsert("a", {"filename": "a2.pdf"})
+
+        total, rows = store.page(offset=0, limit=2)
+        assert total == 3
+        assert rows == [("a", {"filename": "a2.pdf"}), ("b", {"filename": "b.pdf"})]
+
+        total, rows = store.page(offset=2, limit=2)
+        assert rows == [("c", {"filename": "c.pdf"})]
+
+    def test_delete(self, store):
+        """Deleted playbooks disappear from lookups and pages"""
+        store.upsert("a", {})
+        store.upsert("b", {})
+        store.delete("a")
+
+        assert store.get("a") is None
+        assert store.page(offset=0, limit=10) == (1, [("b", {})])
+
+    def test_generation_shared_across_connections(self, tmp_path):
+        """Generation bumps are visible to every store on the same file"""
+        path = str(tmp_path / "playbooks.db")
+        first, second = PlaybookMetadataStore(path), PlaybookMetadataStore(path)
+        assert first.generation() == second.generation() == 0
+
+        first.bump_generation()
+
+        assert second.generation() == 1
@@ -1,7 +1,9 @@
 import pytest
 import tempfile
 import os
-from document_processor import DocumentProcessor, DocumentChunk
+import re
+import zipfile
+from document_processor import DocumentProcessor, DocumentChunk, _read_rels, _slide_part_names
 from pptx import Presentation
 from docx import Document
 import PyPDF2
@@ -120,5 +122,123 @@ class TestDocumentProcessor:
         with pytest.raises(ValueError, match="Unsupported file type"):
             processor.process_document("test.txt", "txt")
 
+class TestChunker:
+    """Test sentence-aware overlapping chunking"""
+    
+    @staticmethod
+    def chunk(text, chunk_size=10, chunk_overlap=3):
+        processor = DocumentProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        return processor._create_chunks(text, page_number=1, chunk_type="test")
+    
+    def test_small_text_is_one_chunk(self):
+        chunks = self.chunk("Just a short line.")
+        assert [c.content for c in chunks] == ["Just a short line."]
+        assert chunks[0].metadata["word_count"] == 4
+    
+    def test_cuts_at_sentence_boundaries(self):
+        text = " ".join(f"Sentence {i} has five words." for i in range(6))
+        chunks = self.chunk(text)
+        
+        assert all(c.content.endswith("words.") for c in chunks)
+        assert chunks[0].content == "Sentence 0 has five words. Sentence 1 has five words."
+        assert chunks[-1].metadata["end_word"] == 30
+    
+    def test_consecutive_chunks_overlap(self):
+        text = " ".join(f"Sentence {i} has five words." for i in range(6))
+        chunks = self.chunk(text)
+        
+        for previous, current in zip(chunks, chunks[1:]):
+            overlap = previous.metadata["end_word"] - current.metadata["start_word"]
+            assert 3 <= overlap <= 6
+            assert current.metadata["end_word"] > previous.metadata["end_word"]
+    
+    def test_unpunctuated_text_cuts_at_chunk_size(self):
+        text = " ".join(f"w{i}" for i in range(25))
+        chunks = self.chunk(text)
+        
+        assert [(c.metadata["start_word"], c.metadata["end_word"]) for c in chunks] == [(0, 10), (7, 17), (14, 24), (21, 25)]
+        assert chunks[1].content == " ".join(f"w{i}" for i in range(7, 17))
+    
+    def test_short_first_sentence_does_not_make_a_tiny_chunk(self):
+        text = "Intro here. " + " ".join(f"w{i}" for i in range(1200))
+        chunks = self.chunk(text, chunk_size=500, chunk_overlap=50)
+        
+        assert [(c.metadata["start_word"], c.metadata["end_word"]) for c in chunks] == [(0, 500), (450, 950), (900, 1202)]
+    
+    def test_every_word_is_covered(self):
+        text = "A b c. " + " ".join(f"w{i}" for i in range(40)) + ". End here now."
+        chunks = self.chunk(text)
+        
+        covered = set()
+        for c in chunks:
+            covered.update(range(c.metadata["start_word"], c.metadata["end_word"]))
+        assert covered == set(range(len(text.split())))
+
+class TestPowerPointPackage:
+    """Test reading slides straight from the .pptx package"""
+    
+    @pytest.fixture
+    def deck_path(self, tmp_path):
+        prs = Presentation()
+        for n in range(1, 4):
+            slide = prs.slides.add_slide(prs.slide_layouts[5])
+            slide.shapes.title.text = f"Slide {n}"
+        path = tmp_path / "deck.pptx"
+        prs.save(str(path))
+        return path
+    
+    @staticmethod
+    def rewrite_part(path, part_name, transform):
+        """Rewrite one part of a zip package in place"""
+        with zipfile.ZipFile(path) as archive:
+            parts = {info.filename: archive.read(info) for info in archive.infolist()}
+        parts[part_name] = transform(parts[part_name].decode()).encode()
+        with zipfile.ZipFile(path, "w") as archive:
+            for name, data in parts.items():
+                archive.writestr(name, data)
+    
+    def slide_titles(self, path):
+        chunks = DocumentProcessor().process_powerpoint(str(path))
+        return [c.content for c in chunks if c.chunk_type == "title"]
+    
+    def test_relative_targets(self, deck_path):
+        with zipfile.ZipFile(deck_path) as archive:
+            rels = _read_rels(archive, "ppt/presentation.xml")
+            assert _slide_part_names(archive) == [
+                "ppt/slides/slide1.xml", "ppt/slides/slide2.xml", "ppt/slides/slide3.xml"
+            ]
+        assert ("http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide",
+                "ppt/slides/slide1.xml") in rels.values()
+    
+    def test_absolute_targets(self, deck_path):
+        self.rewrite_part(deck_path, "ppt/_rels/presentation.xml.rels",
+                          lambda xml: xml.replace('Target="slides/', 'Target="/ppt/slides/'))
+        with zipfile.ZipFile(deck_path) as archive:
+            assert _slide_part_names(archive)[0] == "ppt/slides/slide1.xml"
+        assert self.slide_titles(deck_path) == ["Slide 1", "Slide 2", "Slide 3"]
+    
+    def test_external_targets(self, deck_path):
+        link = ('<Relationship Id="rIdLink" TargetMode="External" Target="https://example.com/brand" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink"/>')
+        self.rewrite_part(deck_path, "ppt/slides/_rels/slide1.xml.rels",
+                          lambda xml: xml.replace("</Relationships>", link + "</Relationships>"))
+        with zipfile.ZipFile(deck_path) as archive:
+            rels = _read_rels(archive, "ppt/slides/slide1.xml")
+        assert rels["rIdLink"][1] == "https://example.com/brand"
+        assert self.slide_titles(deck_path) == ["Slide 1", "Slide 2", "Slide 3"]
+    
+    def test_slide_order_follows_slide_id_list(self, deck_path):
+        # Move the last slide to the front, as reordering in PowerPoint does
+        def move_last_first(xml):
+            ids = re.findall(r"<p:sldId [^>]*/>", xml)
+            return xml.replace("".join(ids), "".join(ids[-1:] + ids[:-1]))
+        self.rewrite_part(deck_path, "ppt/presentation.xml", move_last_first)
+        
+        with zipfile.ZipFile(deck_path) as archive:
+            assert _slide_part_names(archive) == [
+                "ppt/slides/slide3.xml", "ppt/slides/slide1.xml", "ppt/slides/slide2.xml"
+            ]
+        assert self.slide_titles(deck_path) == ["Slide 3", "Slide 1", "Slide 2"]
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -1,17 +1,92 @@
 import chromadb
 from chromadb.config import Settings
 import openai
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 import os
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 from document_processor import DocumentChunk
 from config import settings
+from openai_clients import create_openai_client
+from query_cache import query_cache
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from playbook_metadata import get_playbook_metadata_store
+import base64
 import hashlib
-import json
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# OpenAI accepts up to 2048 inputs per embeddings request and rejects requests
+# over ~300K tokens; stay under both with a rough 4-characters-per-token estimate
+EMBEDDING_BATCH_MAX_INPUTS = 2048
+EMBEDDING_BATCH_MAX_TOKENS = 250_000
+# Bulk embedding requests that may be in flight at once across all concurrent ingests
+EMBEDDING_REQUEST_CONCURRENCY = 8
+_bulk_embedding_slots = threading.BoundedSemaphore(EMBEDDING_REQUEST_CONCURRENCY)
+# Chunks embedded and upserted per step of add_documents (one embeddings request at the
+# default chunk size), and how many steps may be embedding ahead of the upserts
+INGEST_BATCH_SIZE = 256
+INGEST_PREFETCH_BATCHES = 4
+
+# Pre-v2 collection of 1536-dimension text-embedding-ada-002 vectors; its chunks are
+# re-embedded into the current collection by a background migration at startup
+LEGACY_COLLECTION_NAME = "brand_playbooks"
+LEGACY_EMBEDDING_MODEL = "text-embedding-ada-002"
+# Legacy chunks read per step of the migration, and how long a worker's claim on the
+# migration holds without progress before another worker may take over
+LEGACY_MIGRATION_PAGE_SIZE = INGEST_BATCH_SIZE * INGEST_PREFETCH_BATCHES
+LEGACY_MIGRATION_LEASE_SECONDS = 3600
+# Playbook metadata used to live in this Chroma collection, next to placeholder vectors
+LEGACY_METADATA_COLLECTION_NAME = "playbook_metadata"
+_legacy_migration_lock = threading.Lock()
+_legacy_migration_done = False
+
+class EmbeddingMicroBatcher:
+    """Coalesce single-text embedding requests from concurrent threads into one API call.
+
+    The first caller in an empty window becomes the leader: it waits up to `max_wait`
+    seconds (or until `max_batch` texts are queued), embeds everything queued in one
+    request and hands each waiting caller its vector.
+    """
+
+    def __init__(self, embed: Callable[[List[str]], List[List[float]]],
+                 max_batch: int = 96, max_wait: float = 0.01):
+        self._embed = embed
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._condition = threading.Condition()
+        self._pending: List[Tuple[str, Future]] = []
+
+    def embed(self, text: str) -> List[float]:
+        future: Future = Future()
+        with self._condition:
+            self._pending.append((text, future))
+            leader = len(self._pending) == 1
+            if len(self._pending) >= self.max_batch:
+                self._condition.notify_all()
+
+        if leader:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) >= self.max_batch,
+                                         timeout=self.max_wait)
+                batch, self._pending = self._pending, []
+            if len(batch) > 1:
+                logger.debug(f"Coalesced {len(batch)} query embeddings into one request")
+            try:
+                embeddings = self._embed([queued_text for queued_text, _ in batch])
+            except Exception as e:
+                for _, queued_future in batch:
+                    queued_future.set_exception(e)
+            else:
+                for (_, queued_future), embedding in zip(batch, embeddings):
+                    queued_future.set_result(embedding)
+
+        return future.result()
+
 class VectorStore:
     def __init__(self, api_key: Optional[str] = None):
         # Initialize ChromaDB
@@ -25,95 +100,156 @@ class VectorStore:
         if not self.api_key:
             raise ValueError("OpenAI API key is required")
         
-        openai.api_key = self.api_key
+        # Retries are handled per embeddings request by tenacity, not inside the client
+        self.openai_client = create_openai_client(self.api_key, timeout=30.0, max_retries=0)
         self.embedding_model = settings.embedding_model
+        self.embedding_dimensions = settings.embedding_dimensions
+        self.embedding_cache = get_embedding_cache()
+        self.query_embedder = EmbeddingMicroBatcher(
+            self._get_embeddings_batch,
+            max_wait=settings.embedding_batch_window_ms / 1000
+        )
         
-        # Get or create collections
+        # Get or create collections (v2 holds 512-dimension text-embedding-3-small vectors).
+        # Vectors always come from _get_embeddings_batch (cached, throttled, prefetched while
+        # earlier batches are written), so the collection has no embedding function and
+        # Chroma can never fall back to its default MiniLM model
         self.collection = self.client.get_or_create_collection(
-            name="brand_playbooks",
-            metadata={"hnsw:space": "cosine"}
+            name="brand_playbooks_v2",
+            embedding_function=None,
+            metadata={
+                "hnsw:space": "cosine",
+                "hnsw:M": settings.hnsw_m,
+                "hnsw:construction_ef": settings.hnsw_ef_construction,
+                "hnsw:search_ef": settings.hnsw_ef_search
+            }
         )
         
-        # Metadata collection for efficient playbook listing
-        self.metadata_collection = self.client.get_or_create_collection(
-            name="playbook_metadata",
-            metadata={"hnsw:space": "cosine"}
-        )
+        # Pre-v2 chunks awaiting migrate_legacy_collection, if any
+        self.legacy_collection = None
+        self._legacy_checked_generation: Optional[int] = None
+        if not _legacy_migration_done and LEGACY_COLLECTION_NAME in {c.name for c in self.client.list_collections()}:
+            self.legacy_collection = self.client.get_collection(LEGACY_COLLECTION_NAME)
+        
+        # One SQLite row per playbook for listing and lookups
+        self.playbook_metadata = get_playbook_metadata_store()
+        self._import_metadata_collection()
         
         logger.info("VectorStore initialized successfully")
     
-    def add_documents(self, playbook_id: str, chunks: List[DocumentChunk], metadata: Optional[Dict] = None):
-        """Add document chunks to the vector store with improved batching"""
+    def add_documents(self, playbook_id: str, chunks: List[DocumentChunk], metadata: Optional[Dict] = None) -> int:
+        """Add document chunks to the vector store with improved batching
+
+        Returns the number of chunks stored, which is lower than len(chunks) when some
+        chunks repeat the same text.
+        """
         if not chunks:
             logger.warning(f"No chunks to add for playbook {playbook_id}")
-            return
+            return 0
         
         logger.info(f"Adding {len(chunks)} chunks for playbook {playbook_id}")
         
-        # Prepare data for insertion
-        documents = []
-        metadatas = []
-        ids = []
+        # Prepare data for insertion; IDs derive from content, so re-ingesting a playbook
+        # overwrites its chunks instead of duplicating them
+        hashes = [hashlib.sha1(chunk.content.encode()).hexdigest()[:16] for chunk in chunks]
+        # Repeated text (e.g. a footer on every slide) is stored and embedded once; the first
+        # occurrence supplies the metadata and "pages" lists every page it appears on
+        unique_chunks = {}
+        for content_hash, chunk in zip(hashes, chunks):
+            _, _, pages = unique_chunks.setdefault(f"{playbook_id}_{content_hash}", (content_hash, chunk, []))
+            if chunk.page_number not in pages:
+                pages.append(chunk.page_number)
         
-        for i, chunk in enumerate(chunks):
-            documents.append(chunk.content)
-            
-            chunk_metadata = {
+        ids = list(unique_chunks)
+        documents = [chunk.content for _, chunk, _ in unique_chunks.values()]
+        metadatas = [
+            {
                 "playbook_id": playbook_id,
                 "page_number": chunk.page_number,
+                # Chroma metadata values are scalars, so the page list is stored as "1,4,7"
+                "pages": ",".join(str(page) for page in pages),
                 "chunk_type": chunk.chunk_type,
+                "content_hash": content_hash,
                 **chunk.metadata
             }
-            metadatas.append(chunk_metadata)
-            
-            # Create unique ID for each chunk using content hash
-            content_hash = hashlib.md5(chunk.content.encode()).hexdigest()[:8]
-            chunk_id = f"{playbook_id}_{i}_{content_hash}"
-            ids.append(chunk_id)
-        
-        # Get embeddings in batches
-        embeddings = self._get_embeddings_batch(documents)
+            for content_hash, chunk, pages in unique_chunks.values()
+        ]
         
-        # Add to ChromaDB in batches
-        batch_size = 100
-        for i in range(0, len(documents), batch_size):
-            batch_end = min(i + batch_size, len(documents))
-            
-            try:
-                self.collection.add(
-                    documents=documents[i:batch_end],
-                    embeddings=embeddings[i:batch_end],
-                    metadatas=metadatas[i:batch_end],
-                    ids=ids[i:batch_end]
-                )
-                logger.info(f"Added batch {i//batch_size + 1} of {(len(documents)-1)//batch_size + 1}")
-            except Exception as e:
-                logger.error(f"Error adding batch {i//batch_size + 1}: {e}")
-                raise
+        self._upsert_chunks(ids, documents, metadatas)
         
         # Store playbook metadata
-        self._store_playbook_metadata(playbook_id, metadata or {})
+        self._store_playbook_metadata(playbook_id, metadata or {}, chunk_count=len(ids))
+        self._content_changed()
         
         logger.info(f"Successfully added all chunks for playbook {playbook_id}")
+        return len(ids)
 
+    def _upsert_chunks(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        """Embed and upsert chunks in fixed-size steps
+
+        Only a few batches of vectors are alive at once, later batches are embedded while
+        earlier ones are written, and no upsert exceeds Chroma's maximum batch size.
+        """
+        batch_size = min(INGEST_BATCH_SIZE, self.client.max_batch_size)
+        starts = range(0, len(documents), batch_size)
+        with ThreadPoolExecutor(max_workers=INGEST_PREFETCH_BATCHES) as executor:
+            pending = deque()
+            for i in starts[:INGEST_PREFETCH_BATCHES]:
+                pending.append(executor.submit(self._get_embeddings_batch, documents[i:i + batch_size], True))
+            
+            for i in starts:
+                batch_end = i + batch_size
+                embeddings = pending.popleft().result()
+                next_start = i + INGEST_PREFETCH_BATCHES * batch_size
+                if next_start < len(documents):
+                    pending.append(executor.submit(
+                        self._get_embeddings_batch, documents[next_start:next_start + batch_size], True
+                    ))
+                
+                try:
+                    self.collection.upsert(
+                        documents=documents[i:batch_end],
+                        embeddings=embeddings,
+                        metadatas=metadatas[i:batch_end],
+                        ids=ids[i:batch_end]
+                    )
+                except Exception as e:
+                    logger.error(f"Error adding chunks {i}-{min(batch_end, len(documents))}: {e}")
+                    raise
+    
     def search(self, query: str, playbook_id: Optional[str] = None, 
-              top_k: int = 5, score_threshold: float = 0.7) -> List[Dict]:
+              top_k: int = 5, score_threshold: float = 0.4) -> List[Dict]:
         """Search for relevant passages with score threshold"""
         logger.info(f"Searching for: '{query}' in playbook: {playbook_id or 'all'}")
         
-        # Get query embedding
-        query_embedding = self._get_embeddings_batch([query])[0]
+        # Get query embedding, reusing the one computed for identical text; results are only
+        # reused while no process has changed the index since they were cached
+        store_generation = self.playbook_metadata.generation()
+        query_cache.sync(store_generation)
+        generation = query_cache.generation
+        query_embedding = query_cache.get_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.query_embedder.embed(query)
+            query_cache.put_embedding(query, query_embedding)
+        
+        # Near-duplicate questions in the same scope reuse the earlier results
+        scope = (playbook_id, top_k, score_threshold)
+        cached_passages = query_cache.get_results(query_embedding, scope)
+        if cached_passages is not None:
+            logger.info(f"Found {len(cached_passages)} relevant passages (cached)")
+            return cached_passages
         
         # Build where clause
         where = {}
         if playbook_id:
             where["playbook_id"] = playbook_id
         
-        # Search in ChromaDB
+        # Search in ChromaDB; the query is passed as an embedding rather than query_texts
+        # because the semantic result cache above needs the vector anyway
         try:
             results = self.collection.query(
                 query_embeddings=[query_embedding],
-                n_results=top_k * 2,  # Get more results for filtering
+                n_results=top_k,
                 where=where if where else None,
                 include=["documents", "metadatas", "distances"]
             )
@@ -121,47 +257,149 @@ class VectorStore:
             logger.error(f"Error searching ChromaDB: {e}")
             raise
         
-        # Format and filter results
+        # Until the pre-v2 chunks are migrated, search them too so older playbooks stay answerable
+        # Another worker's migration bumps the shared generation, so recheck then whether the
+        # collection still exists instead of querying a deleted one
+        if self.legacy_collection is not None and not _legacy_migration_done:
+            if store_generation != self._legacy_checked_generation:
+                self._legacy_checked_generation = store_generation
+                self._forget_legacy_collection_if_gone()
+            if self.legacy_collection is not None:
+                results = self._merge_legacy_results(results, query, top_k, where)
+        
+        # Chroma returns the nearest first, so the passages above the threshold are a prefix;
+        # similarity = 1 - cosine distance
         passages = []
         if results['documents'] and len(results['documents'][0]) > 0:
-            for i in range(len(results['documents'][0])):
-                score = 1 - results['distances'][0][i]  # Convert distance to similarity
-                
-                # Filter by score threshold
-                if score >= score_threshold:
-                    passages.append({
-                        "content": results['documents'][0][i],
-                        "metadata": results['metadatas'][0][i],
-                        "score": score
-                    })
+            max_distance = 1.0 - score_threshold
+            for document, metadata, distance in zip(results['documents'][0], results['metadatas'][0],
+                                                    results['distances'][0]):
+                if distance > max_distance:
+                    break
+                passages.append({"content": document, "metadata": metadata, "score": 1.0 - distance})
         
-        # Return top_k results after filtering
-        passages = sorted(passages, key=lambda x: x['score'], reverse=True)[:top_k]
+        query_cache.put_results(query_embedding, scope, passages, generation)
         
         logger.info(f"Found {len(passages)} relevant passages")
         return passages
     
-    def list_playbooks(self, page: int = 1, page_size: int = 10) -> Dict[str, any]:
-        """List all playbooks with pagination"""
+    def migrate_legacy_collection(self) -> bool:
+        """Re-embed chunks left in the pre-v2 collection so older playbooks keep working
+
+        Meant to run once in the background (see main.get_vector_store). Workers share
+        the Chroma directory, so the migration is claimed in the metadata store and only
+        the claiming worker runs it; the others keep searching the legacy collection until
+        it is gone. The collection is only dropped after every chunk is upserted; on
+        failure it is kept, the claim is released, and the next start retries.
+        Returns True once nothing is left to migrate.
+        """
+        global _legacy_migration_done
+        if _legacy_migration_done or self.legacy_collection is None:
+            return True
+        # Another thread is already migrating; it sets the flag when done
+        if not _legacy_migration_lock.acquire(blocking=False):
+            return False
+        
         try:
-            # Get all playbook metadata
-            all_metadata = self.metadata_collection.get()
+            if _legacy_migration_done:
+                return True
+            if not self.playbook_metadata.claim_task(LEGACY_COLLECTION_NAME, LEGACY_MIGRATION_LEASE_SECONDS):
+                logger.info(f"Another worker is migrating {LEGACY_COLLECTION_NAME}")
+                return False
             
-            playbooks = []
-            if all_metadata['metadatas']:
-                for i, metadata in enumerate(all_metadata['metadatas']):
-                    playbooks.append({
-                        "id": all_metadata['ids'][i].replace("_metadata", ""),
-                        **metadata
-                    })
+            try:
+                # Read a page at a time so the legacy chunks are never all held in memory;
+                # upserts are keyed by the legacy IDs, so a retry after a partial run is idempotent
+                migrated = 0
+                while True:
+                    page = self.legacy_collection.get(
+                        limit=LEGACY_MIGRATION_PAGE_SIZE,
+                        offset=migrated,
+                        include=["documents", "metadatas"]
+                    )
+                    if not page['ids']:
+                        break
+                    self._upsert_chunks(page['ids'], page['documents'], page['metadatas'])
+                    migrated += len(page['ids'])
+                    self.playbook_metadata.renew_task(LEGACY_COLLECTION_NAME)
+                    logger.info(f"Re-embedded {migrated} chunks from {LEGACY_COLLECTION_NAME}")
+                
+                if migrated:
+                    self._content_changed()
+                self.client.delete_collection(LEGACY_COLLECTION_NAME)
+            except Exception as e:
+                self.playbook_metadata.release_task(LEGACY_COLLECTION_NAME)
+                logger.error(f"Migrating {LEGACY_COLLECTION_NAME} failed, searching it as a fallback: {e}")
+                return self._forget_legacy_collection_if_gone()
             
-            # Apply pagination
-            total = len(playbooks)
-            start = (page - 1) * page_size
-            end = start + page_size
+            self.legacy_collection = None
+            _legacy_migration_done = True
+            logger.info(f"Migrated and removed {LEGACY_COLLECTION_NAME}")
+            return True
+        finally:
+            _legacy_migration_lock.release()
+    
+    def _forget_legacy_collection_if_gone(self) -> bool:
+        """Stop the legacy fallback once the collection has been removed, e.g. by another worker"""
+        global _legacy_migration_done
+        try:
+            if LEGACY_COLLECTION_NAME in {c.name for c in self.client.list_collections()}:
+                return False
+        except Exception as e:
+            logger.warning(f"Could not list collections: {e}")
+            return False
+        self.legacy_collection = None
+        _legacy_migration_done = True
+        return True
+    
+    def _merge_legacy_results(self, results: Dict, query: str, top_k: int, where: Dict) -> Dict:
+        """Add the nearest not-yet-migrated legacy chunks to a v2 query result
+
+        A failing legacy query only loses the fallback, never the search itself.
+        """
+        try:
+            response = self.openai_client.embeddings.create(model=LEGACY_EMBEDDING_MODEL, input=[query])
+            legacy = self.legacy_collection.query(
+                query_embeddings=[response.data[0].embedding],
+                n_results=top_k,
+                where=where if where else None,
+                include=["documents", "metadatas", "distances"]
+            )
+        except Exception as e:
+            logger.warning(f"Fallback search of {LEGACY_COLLECTION_NAME} failed: {e}")
+            self._forget_legacy_collection_if_gone()
+            return results
+        
+        # Chunks already migrated are present in both; keep the v2 copy
+        merged = list(zip(results['distances'][0], results['ids'][0],
+                          results['documents'][0], results['metadatas'][0]))
+        seen = set(results['ids'][0])
+        for row in zip(legacy['distances'][0], legacy['ids'][0], legacy['documents'][0], legacy['metadatas'][0]):
+            if row[1] not in seen:
+                merged.append(row)
+        merged.sort(key=lambda row: row[0])
+        merged = merged[:top_k]
+        
+        return {
+            'ids': [[row[1] for row in merged]],
+            'documents': [[row[2] for row in merged]],
+            'metadatas': [[row[3] for row in merged]],
+            'distances': [[row[0] for row in merged]]
+        }
+    
+    def _content_changed(self):
+        """Retire cached search results and answers in this and every other worker process"""
+        self.playbook_metadata.bump_generation()
+        query_cache.invalidate()
+    
+    def list_playbooks(self, page: int = 1, page_size: int = 10) -> Dict[str, any]:
+        """List all playbooks with pagination"""
+        try:
+            total, rows = self.playbook_metadata.page(offset=(page - 1) * page_size, limit=page_size)
+            playbooks = [{"id": playbook_id, **metadata} for playbook_id, metadata in rows]
             
             return {
-                "playbooks": playbooks[start:end],
+                "playbooks": playbooks,
                 "total": total,
                 "page": page,
                 "page_size": page_size,
@@ -177,16 +415,11 @@ class VectorStore:
         
         try:
             # Delete document chunks
-            results = self.collection.get(
-                where={"playbook_id": playbook_id}
-            )
-            
-            if results['ids']:
-                self.collection.delete(ids=results['ids'])
-                logger.info(f"Deleted {len(results['ids'])} chunks")
+            self.collection.delete(where={"playbook_id": playbook_id})
             
             # Delete metadata
-            self.metadata_collection.delete(ids=[f"{playbook_id}_metadata"])
+            self.playbook_metadata.delete(playbook_id)
+            self._content_changed()
             
             logger.info(f"Successfully deleted playbook: {playbook_id}")
         except Exception as e:
@@ -196,93 +429,141 @@ class VectorStore:
     def get_playbook_info(self, playbook_id: str) -> Optional[Dict]:
         """Get metadata for a specific playbook"""
         try:
-            result = self.metadata_collection.get(
-                ids=[f"{playbook_id}_metadata"]
-            )
-            
-            if result['metadatas'] and len(result['metadatas']) > 0:
-                return result['metadatas'][0]
-            return None
+            return self.playbook_metadata.get(playbook_id)
         except Exception as e:
             logger.error(f"Error getting playbook info: {e}")
             return None
     
-    def _store_playbook_metadata(self, playbook_id: str, metadata: Dict):
+    def _store_playbook_metadata(self, playbook_id: str, metadata: Dict, chunk_count: int):
         """Store playbook metadata for efficient retrieval"""
         try:
-            # Add timestamp and chunk count
-            chunks_result = self.collection.get(
-                where={"playbook_id": playbook_id}
-            )
-            
+            # Add timestamp and the number of chunks just written
             metadata.update({
                 "created_at": metadata.get("created_at", ""),
-                "chunk_count": len(chunks_result['ids']) if chunks_result['ids'] else 0
+                "chunk_count": chunk_count
             })
             
-            # Create a simple embedding for metadata (just zeros)
-            dummy_embedding = [0.0] * 1536  # Ada-002 embedding size
-            
-            self.metadata_collection.upsert(
-                ids=[f"{playbook_id}_metadata"],
-                embeddings=[dummy_embedding],
-                metadatas=[metadata],
-                documents=[json.dumps(metadata)]
-            )
+            self.playbook_metadata.upsert(playbook_id, metadata)
         except Exception as e:
             logger.error(f"Error storing playbook metadata: {e}")
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def _get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """Get embeddings from OpenAI with batching and retry logic"""
-        embeddings = []
-        batch_size = 100  # OpenAI recommended batch size
+    def _import_metadata_collection(self):
+        """Move playbook metadata out of the old Chroma collection into SQLite"""
+        if LEGACY_METADATA_COLLECTION_NAME not in {c.name for c in self.client.list_collections()}:
+            return
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            
-            try:
-                logger.debug(f"Getting embeddings for batch {i//batch_size + 1}")
-                client = openai.OpenAI(api_key=self.api_key)
-                response = client.embeddings.create(
-                    model=self.embedding_model,
-                    input=batch
-                )
-                
-                batch_embeddings = [embedding.embedding for embedding in response.data]
-                embeddings.extend(batch_embeddings)
-                
-                # Log token usage
-                if hasattr(response, 'usage'):
-                    logger.info(f"Embedding tokens used: {response.usage.total_tokens}")
-                    
-            except Exception as e:
-                logger.error(f"Error getting embeddings for batch {i//batch_size + 1}: {e}")
-                raise
+        legacy = self.client.get_collection(LEGACY_METADATA_COLLECTION_NAME)
+        legacy_data = legacy.get(include=["metadatas"])
+        for metadata_id, metadata in zip(legacy_data['ids'], legacy_data['metadatas'] or ()):
+            self.playbook_metadata.upsert(metadata_id[:-len("_metadata")], metadata)
+        self.client.delete_collection(LEGACY_METADATA_COLLECTION_NAME)
+        logger.info(f"Moved {len(legacy_data['ids'])} playbook metadata entries to SQLite")
+    
+    def _get_embeddings_batch(self, texts: List[str], bulk: bool = False) -> List[List[float]]:
+        """Get embeddings, from the on-disk cache where possible and OpenAI for the rest.
+
+        `bulk` requests (ingestion) always wait for a process-wide request slot.
+        """
+        keys = [EmbeddingCache.key(self.embedding_model, self.embedding_dimensions, text) for text in texts]
+        cached = self.embedding_cache.get_many(keys)
         
-        return embeddings
+        # Embed each distinct uncached text once, however often it repeats
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            logger.debug(f"Embedding cache hit for {len(texts) - len(missing)} of {len(texts)} texts")
+            computed = dict(zip(missing, self._request_embeddings(list(missing.values()), bulk)))
+            self.embedding_cache.set_many(computed)
+            cached.update(computed)
+        
+        # Vectors stay float32 arrays up to here; Chroma's API only accepts lists of floats
+        return [cached[key].tolist() for key in keys]
+    
+    def _request_embeddings(self, texts: List[str], bulk: bool = False) -> np.ndarray:
+        """Get embeddings from OpenAI as one float32 matrix, packing as many texts per request as the API allows"""
+        batches = list(self._embedding_batches(texts))
+        if len(batches) <= 1:
+            embed = self._embed_batch_throttled if bulk else self._embed_batch
+            return embed(1, batches[0])
+        
+        # Large documents need several requests; overlap their round trips
+        with ThreadPoolExecutor(max_workers=min(EMBEDDING_REQUEST_CONCURRENCY, len(batches))) as executor:
+            results = executor.map(self._embed_batch_throttled, range(1, len(batches) + 1), batches)
+            return np.concatenate(list(results))
+    
+    def _embed_batch_throttled(self, batch_number: int, batch: List[str]) -> np.ndarray:
+        """Embed one bulk batch once a process-wide request slot is free.
+
+        Parallel uploads share the slots, so they cannot multiply the request rate; queries
+        skip the queue.
+        """
+        with _bulk_embedding_slots:
+            return self._embed_batch(batch_number, batch)
+    
+    @retry(
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(multiplier=1, min=2, max=30),
+        retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)),
+        reraise=True
+    )
+    def _embed_batch(self, batch_number: int, batch: List[str]) -> np.ndarray:
+        """Embed one request's worth of texts"""
+        try:
+            logger.debug(f"Getting embeddings for batch {batch_number} ({len(batch)} texts)")
+            # base64 float32 is ~4x smaller on the wire than a JSON float list and decodes
+            # straight into an array
+            response = self.openai_client.embeddings.create(
+                model=self.embedding_model,
+                input=batch,
+                dimensions=self.embedding_dimensions,
+                encoding_format="base64"
+            )
+            
+            # Log token usage
+            if hasattr(response, 'usage'):
+                logger.info(f"Embedding tokens used: {response.usage.total_tokens}")
+            
+            embeddings = np.empty((len(batch), self.embedding_dimensions), dtype=np.float32)
+            for item in response.data:
+                embeddings[item.index] = np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32)
+            return embeddings
+        except Exception as e:
+            logger.error(f"Error getting embeddings for batch {batch_number}: {e}")
+            raise
+    
+    @staticmethod
+    def _embedding_batches(texts: List[str]) -> Iterator[List[str]]:
+        """Split texts into the fewest requests that fit the embeddings API input and token limits"""
+        batch = []
+        batch_tokens = 0
+        for text in texts:
+            tokens = len(text) // 4 + 1
+            if batch and (len(batch) >= EMBEDDING_BATCH_MAX_INPUTS
+                          or batch_tokens + tokens > EMBEDDING_BATCH_MAX_TOKENS):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch
     
     def get_statistics(self) -> Dict[str, any]:
         """Get vector store statistics"""
         try:
             # Get collection stats
             collection_count = self.collection.count()
-            metadata_count = self.metadata_collection.count()
-            
-            # Get unique playbooks
-            all_docs = self.collection.get()
-            unique_playbooks = set()
-            
-            if all_docs['metadatas']:
-                for metadata in all_docs['metadatas']:
-                    if 'playbook_id' in metadata:
-                        unique_playbooks.add(metadata['playbook_id'])
+            metadata_count = self.playbook_metadata.count()
             
             return {
                 "total_chunks": collection_count,
-                "total_playbooks": len(unique_playbooks),
+                # One metadata entry is stored per playbook
+                "total_playbooks": metadata_count,
                 "metadata_entries": metadata_count,
-                "embedding_model": self.embedding_model
+                "embedding_model": self.embedding_model,
+                "query_cache": query_cache.stats()
             }
         except Exception as e:
             logger.error(f"Error getting statistics: {e}")